@@ -1,5 +1,171 @@
+import argparse
+import json
 import os
-import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import count, instrumented, phase
+
+# Enough for every signature below, including the third M2TS sync byte
+PROBE_SIZE = 400
+DEFAULT_JOURNAL = "rename_journal.jsonl"
+# ISO base media major brands of MP4 video, others like heic, avif or M4A aren't video
+MP4_BRANDS = {
+    b"isom",
+    b"iso2",
+    b"iso3",
+    b"iso4",
+    b"iso5",
+    b"iso6",
+    b"mp41",
+    b"mp42",
+    b"avc1",
+    b"M4V ",
+    b"M4VH",
+    b"M4VP",
+    b"dash",
+    b"mmp4",
+    b"MSNV",
+    b"XAVC",
+    b"f4v ",
+}
+
+
+def detect_container(head):
+    """
+    Identify a video container from the first bytes of a file.
+
+    Args:
+        head (bytes): Beginning of the file, PROBE_SIZE bytes or less
+
+    Returns:
+        str: Extension with leading dot, or None if not a known video container
+    """
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        if brand == b"qt  ":
+            return ".mov"
+        if brand.startswith(b"3g2"):
+            return ".3g2"
+        if brand.startswith(b"3gp"):
+            return ".3gp"
+        return ".mp4" if brand in MP4_BRANDS else None
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        # EBML header, the DocType tells Matroska and WebM apart
+        return ".webm" if b"webm" in head[:64] else ".mkv"
+    if head[:4] == b"RIFF" and head[8:12] == b"AVI ":
+        return ".avi"
+    if head.startswith(b"FLV\x01"):
+        return ".flv"
+    if head.startswith(b"\x30\x26\xb2\x75\x8e\x66\xcf\x11"):
+        return ".wmv"
+    if head.startswith(b"\x00\x00\x01\xba"):
+        return ".mpg"
+    # Sync bytes of three packets in a row, a single "G" starts every GIF
+    if len(head) > 376 and head[0:377:188] == b"GGG":
+        return ".ts"
+    if len(head) > 388 and head[4:389:192] == b"GGG":
+        return ".m2ts"
+    if head.startswith(b"OggS"):
+        return ".ogv"
+    return None
+
+
+def probe_file(path):
+    """Read only the first PROBE_SIZE bytes of a file and detect its container"""
+    with open(path, "rb") as file:
+        return detect_container(file.read(PROBE_SIZE))
+
+
+def iter_extensionless_files(directory_path, recursive=False):
+    """Yield paths of files without an extension"""
+    for dirpath, dirnames, filenames in os.walk(directory_path):
+        for filename in filenames:
+            if not os.path.splitext(filename)[1]:
+                yield os.path.join(dirpath, filename)
+        if not recursive:
+            break
+
+
+def detect_and_rename(directory_path, recursive=False, workers=16, journal_path=None):
+    """
+    Add the extension matching the detected container to files without an extension.
+
+    Files are probed in parallel on a thread pool, every rename is appended to a JSON
+    lines journal as it happens, so it can be reverted with undo_renames.
+
+    Args:
+        directory_path (str): Path to the directory containing files
+        recursive (bool): Also process subdirectories
+        workers (int): Number of files probed at the same time
+        journal_path (str): Rename journal, defaults to rename_journal.jsonl in the directory
+    """
+    if not os.path.isdir(directory_path):
+        print(f"Error: Directory '{directory_path}' does not exist.")
+        return
+
+    journal_path = journal_path or os.path.join(directory_path, DEFAULT_JOURNAL)
+    with phase("list"):
+        files = list(iter_extensionless_files(directory_path, recursive))
+    count("files", len(files))
+    renamed_count = 0
+
+    with (
+        ThreadPoolExecutor(max_workers=workers) as executor,
+        open(journal_path, "a", encoding="utf-8") as journal,
+    ):
+        results = executor.map(_probe_or_error, files)
+        for old_path, (extension, error) in zip(files, results):
+            if error is not None:
+                print(f"Error: couldn't read '{old_path}': {error}")
+                continue
+            if extension is None:
+                print(f"Skipping '{old_path}' - not a recognized video container")
+                continue
+
+            new_path = old_path + extension
+            if os.path.exists(new_path):
+                print(f"Warning: '{new_path}' already exists. Skipping '{old_path}'")
+                continue
+
+            try:
+                os.rename(old_path, new_path)
+            except OSError as e:
+                print(f"Error: couldn't rename '{old_path}': {e}")
+                continue
+
+            journal.write(json.dumps({"old": old_path, "new": new_path}) + "\n")
+            journal.flush()
+            print(f"Renamed: '{old_path}' -> '{new_path}'")
+            renamed_count += 1
+            count("renamed")
+
+    print(f"\nOperation completed. {renamed_count} files were renamed.")
+    print(f"Journal: {journal_path}")
+
+
+def _probe_or_error(path):
+    try:
+        return probe_file(path), None
+    except OSError as e:
+        return None, e
+
+
+def undo_renames(journal_path):
+    """Revert the renames recorded in a journal, newest first"""
+    with open(journal_path, encoding="utf-8") as journal:
+        renames = [json.loads(line) for line in journal if line.strip()]
+
+    reverted = 0
+    for rename in reversed(renames):
+        old_path, new_path = rename["old"], rename["new"]
+        if not os.path.exists(new_path) or os.path.exists(old_path):
+            print(f"Warning: can't revert '{new_path}' -> '{old_path}', skipping")
+            continue
+        os.rename(new_path, old_path)
+        print(f"Reverted: '{new_path}' -> '{old_path}'")
+        reverted += 1
+
+    print(f"\nUndo completed. {reverted} of {len(renames)} renames reverted.")
 
 
 def add_mp4_extension(directory_path):
@@ -50,6 +216,7 @@ def add_mp4_extension(directory_path):
             os.rename(old_path, new_path)
             print(f"Renamed: '{filename}' -> '{new_filename}'")
             renamed_count += 1
+            count("renamed")
 
         print(f"\nOperation completed. {renamed_count} files were renamed.")
 
@@ -61,13 +228,49 @@ def add_mp4_extension(directory_path):
         print(f"An unexpected error occurred: {e}")
 
 
+@instrumented("add_mp4_extension_to_all_files_in_dir")
 def main():
     """
     Main function to handle user input and execute the renaming operation.
     """
+    parser = argparse.ArgumentParser(
+        description="Add .mp4 extension to files, or the extension of their detected container"
+    )
+    parser.add_argument("directory_path", nargs="?", help="Directory with the files")
+    parser.add_argument(
+        "--detect",
+        action="store_true",
+        help="Sniff the first bytes of files without an extension and add the matching extension (.mp4, .mkv, .webm, .ts, ...)",
+    )
+    parser.add_argument(
+        "-r",
+        "--recursive",
+        action="store_true",
+        help="With --detect, include subdirectories",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=16,
+        help="With --detect, parallel probes (default: 16)",
+    )
+    parser.add_argument(
+        "--journal",
+        help=f"With --detect, rename journal path (default: DIR/{DEFAULT_JOURNAL})",
+    )
+    parser.add_argument(
+        "--undo", metavar="JOURNAL", help="Revert the renames in a journal"
+    )
+    args = parser.parse_args()
+
+    if args.undo:
+        undo_renames(args.undo)
+        return
+
     # If directory path is provided as command line argument
-    if len(sys.argv) > 1:
-        directory_path = sys.argv[1]
+    if args.directory_path:
+        directory_path = args.directory_path
     else:
         # Ask user for directory path
         directory_path = input("Enter the directory path: ").strip()
@@ -76,14 +279,26 @@ def main():
     directory_path = directory_path.strip("\"'")
 
     # Confirm with user before proceeding
-    print(f"\nThis will add '.mp4' extension to all files in: {directory_path}")
-    print("Files that already have .mp4 extension will be skipped.")
+    if args.detect:
+        scope = " and its subdirectories" if args.recursive else ""
+        print(
+            "\nThis will add the detected container extension to all files "
+            f"without an extension in: {directory_path}{scope}"
+        )
+        print("Files that aren't recognized as video will be skipped.")
+    else:
+        print(f"\nThis will add '.mp4' extension to all files in: {directory_path}")
+        print("Files that already have .mp4 extension will be skipped.")
     confirmation = input("Do you want to continue? (y/n): ").strip().lower()
 
-    if confirmation in ["y", "yes"]:
-        add_mp4_extension(directory_path)
-    else:
+    if confirmation not in ["y", "yes"]:
         print("Operation cancelled.")
+    elif args.detect:
+        detect_and_rename(
+            directory_path, args.recursive, max(args.workers, 1), args.journal
+        )
+    else:
+        add_mp4_extension(directory_path)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,66 @@
+"""
+Benchmark find_duplicates_in_txt: lines/sec of the parallel engine per worker count,
+compared to the single-threaded find_duplicate_lines.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from bench_suite import generate_lines_file
+from find_duplicates_in_txt import find_duplicate_lines, find_duplicate_lines_parallel
+
+
+def count_lines(path: Path) -> int:
+    with open(path, "rb") as file:
+        return sum(
+            chunk.count(b"\n") for chunk in iter(lambda: file.read(1 << 20), b"")
+        )
+
+
+def measure(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "file", nargs="?", help="Text file to use (default: generate a synthetic one)"
+    )
+    parser.add_argument(
+        "--lines", type=int, default=5_000_000, help="Synthetic file lines"
+    )
+    parser.add_argument(
+        "--distinct", type=int, default=1_000_000, help="Synthetic distinct lines"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if args.file:
+            path = Path(args.file)
+        else:
+            path = Path(temp_dir) / "lines.txt"
+            generate_lines_file(path, args.lines, args.distinct)
+
+        lines = count_lines(path)
+        print(f"{path}: {lines} lines, {path.stat().st_size / 1024 / 1024:.1f} MB")
+
+        elapsed = measure(find_duplicate_lines, path)
+        print(f"{'sequential':>12}: {lines / elapsed:>14,.0f} lines/sec")
+
+        workers = 1
+        cpu_count = os.cpu_count() or 1
+        while True:
+            elapsed = measure(find_duplicate_lines_parallel, path, workers)
+            print(f"{f'{workers} workers':>12}: {lines / elapsed:>14,.0f} lines/sec")
+            if workers >= cpu_count:
+                break
+            workers = min(workers * 2, cpu_count)
+
+
+if __name__ == "__main__":
+    main()
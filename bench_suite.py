@@ -0,0 +1,348 @@
+"""
+Benchmark suite for the filesystem and text tools.
+
+Generates deterministic synthetic data (a directory tree, a text list with duplicates
+and a javguru file listing), runs every benchmark in a fresh process and prints
+throughput and peak memory as JSON, so runs can be compared across versions.
+
+Usage: python bench_suite.py [--text-mb 2048] [--only list_files ...] [-o results.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+from instrumentation import peak_rss_bytes
+
+EXTENSIONS = ["mp4", "mkv", "cbz", "txt", "jpg"]
+# Dependencies the cheap tools must not import at startup
+HEAVY_MODULES = {"PIL", "rarfile", "requests", "send2trash", "unidecode"}
+STARTUP_RUNS = 20
+
+
+def generate_tree(root: Path, fanout: int, depth: int, files_per_dir: int, seed=0):
+    """Create a directory tree with fanout subdirectories per level and empty files"""
+    rng = random.Random(seed)
+    dirs = 0
+    files = 0
+    stack = [(root, 0)]
+    while stack:
+        directory, level = stack.pop()
+        directory.mkdir(parents=True, exist_ok=True)
+        dirs += 1
+        for i in range(files_per_dir):
+            (directory / f"file_{i:04}.{rng.choice(EXTENSIONS)}").touch()
+            files += 1
+        if level < depth:
+            stack.extend((directory / f"dir_{i:03}", level + 1) for i in range(fanout))
+    return dirs, files
+
+
+def generate_lines_file(path: Path, lines: int, distinct: int, seed=0):
+    """Write a deterministic text file of `lines` lines drawn from `distinct` values"""
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as file:
+        for _ in range(lines):
+            file.write(f"[ABC-{rng.randrange(distinct):06}] Some description.mp4\n")
+
+
+def generate_text_file(path: Path, megabytes: int, duplicate_ratio=0.3, seed=0):
+    """Write about `megabytes` MB of lines, duplicate_ratio of them repeating earlier ones"""
+    rng = random.Random(seed)
+    target = megabytes * 1024 * 1024
+    written = 0
+    lines = 0
+    with open(path, "w", encoding="utf-8") as file:
+        while written < target:
+            if lines and rng.random() < duplicate_ratio:
+                value = rng.randrange(lines)
+            else:
+                value = lines
+            line = f"entry {value:010} {'x' * rng.randrange(10, 60)}\n"
+            file.write(line)
+            written += len(line)
+            lines += 1
+    return lines
+
+
+def generate_id_listing(path: Path, count: int, seed=0):
+    """Write a Total Commander style '[ID] description.mp4' listing with unique ids"""
+    rng = random.Random(seed)
+    prefixes = ["ABC", "JUQ", "SSIS", "MIDV", "IPX"]
+    with open(path, "w", encoding="utf-8") as file:
+        for i in range(count):
+            words = " ".join(
+                rng.choice(["red", "blue", "cat", "dog", "sky"]) for _ in range(6)
+            )
+            file.write(f"[{rng.choice(prefixes)}-{i:06}] {words}.mp4\n")
+    return count
+
+
+# Every benchmark gets the data paths and returns (items processed, unit)
+
+
+def bench_list_files_recursive(data):
+    from list_files_with_extension import list_files_with_extension
+
+    files = list_files_with_extension(data["tree"], "mp4", max_depth=sys.maxsize)
+    return len(files), "files"
+
+
+def bench_list_files_parallel(data):
+    from list_files_with_extension import iter_files_with_extension
+
+    files = iter_files_with_extension(data["tree"], "mp4", max_depth=sys.maxsize)
+    return sum(1 for _ in files), "files"
+
+
+def bench_find_folders(data):
+    from find_folders_without_extension import find_folders_without_extension
+
+    return len(find_folders_without_extension(data["tree"], "cbz")), "folders"
+
+
+def bench_find_folders_multi(data):
+    from find_folders_without_extension import scan_extensions
+
+    return len(scan_extensions(data["tree"], EXTENSIONS)), "folders"
+
+
+def bench_find_duplicate_lines(data):
+    from find_duplicates_in_txt import find_duplicate_lines
+
+    find_duplicate_lines(data["text"])
+    return data["text_lines"], "lines"
+
+
+def bench_find_duplicate_lines_parallel(data):
+    from find_duplicates_in_txt import find_duplicate_lines_parallel
+
+    find_duplicate_lines_parallel(data["text"])
+    return data["text_lines"], "lines"
+
+
+def bench_find_duplicate_lines_external(data):
+    from find_duplicates_in_txt import find_duplicate_lines_external
+
+    for _ in find_duplicate_lines_external(data["text"], 64 * 1024 * 1024):
+        pass
+    return data["text_lines"], "lines"
+
+
+def bench_extract_id_and_description(data):
+    from javguru.files import extract_id_and_description, iter_lines
+
+    count = 0
+    for line in iter_lines([data["ids"]]):
+        extract_id_and_description(line)
+        count += 1
+    return count, "lines"
+
+
+def bench_javguru_insert_row(data):
+    from javguru.db import JavguruDatabase
+    from javguru.files import extract_id_and_description, iter_lines
+
+    db_path = Path(data["work"]) / f"insert_{os.getpid()}.db"
+    db = JavguruDatabase(str(db_path), backup=False)
+    count = 0
+    for line in iter_lines([data["ids"]]):
+        if count == data["db_rows"]:
+            break
+        db.insert_row(*extract_id_and_description(line))
+        count += 1
+    return count, "rows"
+
+
+def bench_javguru_sync_rows(data):
+    from javguru.db import JavguruDatabase
+    from javguru.files import extract_id_and_description, iter_lines
+
+    db_path = Path(data["work"]) / f"sync_{os.getpid()}.db"
+    db = JavguruDatabase(str(db_path), backup=False)
+    rows = [extract_id_and_description(line) for line in iter_lines([data["ids"]])]
+    db.sync_rows(rows, [])
+    return len(rows), "rows"
+
+
+def bench_cli_startup(data):
+    """Whole process runs of `scripts list-files`, fails if a heavy dependency is imported"""
+    command = [
+        sys.executable,
+        str(Path(__file__).with_name("cli.py")),
+        "list-files",
+        data["tree"],
+        "mp4",
+    ]
+
+    importtime = subprocess.run(
+        [command[0], "-X", "importtime", *command[1:]],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    imported = {
+        line.rsplit("|", 1)[1].strip().split(".")[0]
+        for line in importtime.splitlines()
+        if line.startswith("import time:")
+    }
+    if imported & HEAVY_MODULES:
+        raise RuntimeError(
+            f"list-files imports {', '.join(sorted(imported & HEAVY_MODULES))}"
+        )
+
+    for _ in range(STARTUP_RUNS):
+        subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+    return STARTUP_RUNS, "runs"
+
+
+BENCHMARKS = {
+    "list_files_recursive": bench_list_files_recursive,
+    "list_files_parallel": bench_list_files_parallel,
+    "find_folders": bench_find_folders,
+    "find_folders_multi": bench_find_folders_multi,
+    "find_duplicate_lines": bench_find_duplicate_lines,
+    "find_duplicate_lines_parallel": bench_find_duplicate_lines_parallel,
+    "find_duplicate_lines_external": bench_find_duplicate_lines_external,
+    "extract_id_and_description": bench_extract_id_and_description,
+    "javguru_insert_row": bench_javguru_insert_row,
+    "javguru_sync_rows": bench_javguru_sync_rows,
+    "cli_startup": bench_cli_startup,
+}
+
+
+def _run_benchmark(name, data):
+    """Runs in a fresh process, so peak memory belongs to this benchmark alone"""
+    baseline = peak_rss_bytes()
+    start = time.perf_counter()
+    items, unit = BENCHMARKS[name](data)
+    seconds = time.perf_counter() - start
+    peak = peak_rss_bytes()
+    return {
+        "items": items,
+        "unit": unit,
+        "seconds": round(seconds, 4),
+        "throughput": round(items / seconds, 1) if seconds else None,
+        "peak_rss_bytes": peak,
+        "baseline_rss_bytes": baseline,
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def generate_data(work: Path, args) -> dict:
+    tree = work / "tree"
+    text = work / "text.txt"
+    ids = work / "ids.txt"
+
+    print("Generating data...", file=sys.stderr)
+    dirs, files = generate_tree(tree, args.fanout, args.depth, args.files_per_dir)
+    text_lines = generate_text_file(text, args.text_mb)
+    generate_id_listing(ids, args.ids)
+
+    return {
+        "work": str(work),
+        "tree": str(tree),
+        "tree_dirs": dirs,
+        "tree_files": files,
+        "text": str(text),
+        "text_lines": text_lines,
+        "ids": str(ids),
+        "id_count": args.ids,
+        "db_rows": args.db_rows,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the filesystem and text tools, results as JSON"
+    )
+    parser.add_argument(
+        "--fanout",
+        type=int,
+        default=6,
+        help="Subdirectories per directory (default: 6)",
+    )
+    parser.add_argument("--depth", type=int, default=4, help="Tree depth (default: 4)")
+    parser.add_argument("--files-per-dir", type=int, default=20, help="Default: 20")
+    parser.add_argument(
+        "--text-mb", type=int, default=100, help="Text list size in MB (default: 100)"
+    )
+    parser.add_argument(
+        "--ids",
+        type=int,
+        default=200_000,
+        help="Javguru listing lines (default: 200000)",
+    )
+    parser.add_argument(
+        "--db-rows",
+        type=int,
+        default=2_000,
+        help="Rows for the per-row insert_row benchmark, it commits every row (default: 2000)",
+    )
+    parser.add_argument(
+        "--only", nargs="+", choices=BENCHMARKS, help="Run only these benchmarks"
+    )
+    parser.add_argument(
+        "--work-dir", help="Where to generate data (default: a temporary directory)"
+    )
+    parser.add_argument("-o", "--output", help="Write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as work:
+        data = generate_data(Path(work), args)
+
+        results = {}
+        for name in args.only or BENCHMARKS:
+            print(f"Running {name}...", file=sys.stderr)
+            with ProcessPoolExecutor(
+                max_workers=1, mp_context=get_context("spawn")
+            ) as executor:
+                results[name] = executor.submit(_run_benchmark, name, data).result()
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "params": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("only", "output", "work_dir")
+        },
+        "data": {
+            key: data[key]
+            for key in ("tree_dirs", "tree_files", "text_lines", "id_count")
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
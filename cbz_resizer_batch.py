@@ -2,12 +2,19 @@ import os
 import shutil
 import sys
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-import rarfile
 from PIL import Image
 from send2trash import send2trash
 
+from instrumentation import count, instrumented, phase
+
+COMIC_EXTENSIONS = (".cbz", ".cbr")
+IMAGE_EXTENSIONS = [".jpg", ".jpeg", ".png", ".gif", ".bmp"]
+VERIFY_WORKERS = 4
+TEMP_FOLDER = Path("temp_folder")
+
 
 def remove_temp_folder(temp_folder):
     """Rimuove la cartella temporanea."""
@@ -58,6 +65,8 @@ def extract_comic_book(input_file, temp_folder):
         with zipfile.ZipFile(input_file, "r") as comic_file:
             comic_file.extractall(temp_folder)
     elif input_file.suffix.lower() == ".cbr":
+        import rarfile
+
         with rarfile.RarFile(input_file, "r") as comic_file:
             comic_file.extractall(temp_folder)
     else:
@@ -66,18 +75,18 @@ def extract_comic_book(input_file, temp_folder):
 
 def compress_comic_book(input_file, output_file, max_dimension):
     """Comprime un file di fumetti (CBZ o CBR) ridimensionando le immagini al suo interno e crea un nuovo CBZ."""
-    temp_folder = Path("temp_folder")
+    temp_folder = TEMP_FOLDER
     temp_folder.mkdir(exist_ok=True)
 
-    extract_comic_book(input_file, temp_folder)
+    with phase("extract"):
+        extract_comic_book(input_file, temp_folder)
 
-    image_extensions = [".jpg", ".jpeg", ".png", ".gif", ".bmp"]
     images = list(temp_folder.glob("**/*"))
     # Filtra i file che iniziano con '._' e i file che non sono immagini
     images = [
         img
         for img in images
-        if img.suffix.lower() in image_extensions and not img.name.startswith("._")
+        if img.suffix.lower() in IMAGE_EXTENSIONS and not img.name.startswith("._")
     ]
     total_images = len(images)
     processed_images = 0
@@ -86,15 +95,20 @@ def compress_comic_book(input_file, output_file, max_dimension):
     last_new_width = last_new_height = 0
 
     for image_path in images:
-        original_width, original_height, new_width, new_height = compress_image(
-            image_path, max_dimension
-        )
+        with phase("compress_image"):
+            original_width, original_height, new_width, new_height = compress_image(
+                image_path, max_dimension
+            )
+        count("images")
         last_original_width, last_original_height = original_width, original_height
         last_new_width, last_new_height = new_width, new_height
         processed_images += 1
         update_progress_bar(total_images, processed_images)
 
-    with zipfile.ZipFile(output_file, "w", zipfile.ZIP_DEFLATED) as new_comic:
+    with (
+        phase("pack"),
+        zipfile.ZipFile(output_file, "w", zipfile.ZIP_DEFLATED) as new_comic,
+    ):
         for file in temp_folder.rglob("*"):
             if file.is_file():
                 new_comic.write(file, file.relative_to(temp_folder))
@@ -112,8 +126,48 @@ def compress_comic_book(input_file, output_file, max_dimension):
         max_dimension,
     )
 
-    print(f"Removing to trash: {input_file}")
-    send2trash(os.path.normpath(input_file))
+    count("bytes_in", os.path.getsize(input_file))
+    count("bytes_out", os.path.getsize(output_file))
+
+
+def verify_comic_book(comic_path):
+    """
+    Verifica che un CBZ sia leggibile: CRC di tutti i file e intestazione di ogni immagine.
+
+    Returns:
+        str: Descrizione del primo errore trovato, None se il file è integro
+    """
+    try:
+        with zipfile.ZipFile(comic_path, "r") as comic_file:
+            bad_file = comic_file.testzip()
+            if bad_file is not None:
+                return f"CRC errato per {bad_file}"
+
+            for name in comic_file.namelist():
+                if Path(name).suffix.lower() not in IMAGE_EXTENSIONS:
+                    continue
+                # Image.open legge solo l'intestazione, non decodifica l'immagine
+                with comic_file.open(name) as image_file, Image.open(image_file):
+                    pass
+    except Exception as e:
+        return str(e)
+    return None
+
+
+def verify_and_trash(input_file, output_file):
+    """Sposta nel cestino il file originale solo se il nuovo file è integro."""
+    with phase("verify"):
+        error = verify_comic_book(output_file)
+    if error is not None:
+        count("verify_failed")
+        return error
+
+    print(f"Verified {output_file}, removing to trash: {input_file}")
+    try:
+        send2trash(os.path.normpath(input_file))
+    except Exception as e:
+        return f"couldn't remove to trash: {e}"
+    return None
 
 
 def print_size_info(
@@ -142,6 +196,7 @@ def print_size_info(
     print("-" * 70)
 
 
+@instrumented("cbz_resizer_batch")
 def main():
     """Funzione principale che gestisce l'input dell'utente e avvia il processo di compressione."""
     if len(sys.argv) < 2 or len(sys.argv) > 3:
@@ -160,14 +215,61 @@ def main():
         except ValueError:
             sys.exit(1)
 
-    for input_file in input_dir.rglob(f"*{CBZ}"):
-        if len(input_file.suffixes) > 1 and input_file.suffixes[-2] == RESIZED:
-            print(f"Skipping: {input_file}")
-            continue
+    # Elenco completo prima di iniziare, i nuovi file non devono essere ripresi
+    input_files = sorted(
+        file
+        for file in input_dir.rglob("*")
+        if file.suffix.lower() in COMIC_EXTENSIONS and file.is_file()
+    )
 
-        output_file = input_file.with_name(f"{input_file.stem}{RESIZED}{CBZ}")
-        print(f"Compressing: {input_file}")
-        compress_comic_book(input_file, output_file, MAX_DIMENSION)
+    failed = 0
+    verifications = {}
+    planned = set()
+    with ThreadPoolExecutor(max_workers=VERIFY_WORKERS) as executor:
+        for input_file in input_files:
+            if len(input_file.suffixes) > 1 and input_file.suffixes[-2] == RESIZED:
+                print(f"Skipping: {input_file}")
+                continue
+
+            # foo.cbr diventa foo.cbr.rsz.cbz, per non scrivere sopra foo.rsz.cbz di un foo.cbz
+            if input_file.suffix.lower() == CBZ:
+                output_file = input_file.with_name(f"{input_file.stem}{RESIZED}{CBZ}")
+            else:
+                output_file = input_file.with_name(f"{input_file.name}{RESIZED}{CBZ}")
+            # Due originali con lo stesso file di output farebbero cestinare quello non compresso
+            if output_file in planned or output_file.exists():
+                print(f"Skipping {input_file}, {output_file} already exists")
+                failed += 1
+                continue
+            planned.add(output_file)
+
+            print(f"Compressing: {input_file}")
+            try:
+                compress_comic_book(input_file, output_file, MAX_DIMENSION)
+            except Exception as e:
+                # Un file illeggibile non deve fermare il batch, né restare in TEMP_FOLDER
+                print(f"\nCouldn't compress {input_file}, skipping: {e}")
+                remove_temp_folder(TEMP_FOLDER)
+                # Un output parziale farebbe saltare questo file nelle esecuzioni successive
+                output_file.unlink(missing_ok=True)
+                failed += 1
+                continue
+            count("archives")
+            # Verificato in background mentre si comprime il file successivo
+            future = executor.submit(verify_and_trash, input_file, output_file)
+            verifications[future] = (input_file, output_file)
+
+    for future, (input_file, output_file) in verifications.items():
+        error = future.result()
+        if error is not None:
+            failed += 1
+            print(
+                f"Verification of {output_file} failed, keeping {input_file}: {error}"
+            )
+
+    if failed:
+        print(f"{failed} files failed, their originals were kept")
+        sys.exit(1)
 
 
 if __name__ == "__main__":
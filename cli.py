@@ -0,0 +1,88 @@
+"""
+Single entry point for all the scripts: `scripts COMMAND [ARGS...]`.
+
+Only the module of the requested command is imported, so cheap tools don't pay for
+the imports (Pillow, requests, ...) of the others. Every command takes the same
+arguments as running its script directly, plus --stats/--profile (see instrumentation).
+"""
+
+import argparse
+import importlib
+import sys
+
+# Command name: (module, description)
+COMMANDS = {
+    "add-mp4-extension": (
+        "add_mp4_extension_to_all_files_in_dir",
+        "Add .mp4, or the detected container extension, to files",
+    ),
+    "cbz-resize": ("cbz_resizer_batch", "Downscale the images of CBZ/CBR archives"),
+    "comic-duplicates": (
+        "comic_phash_index",
+        "Index page perceptual hashes and find duplicate chapters",
+    ),
+    "detect-scenes": (
+        "detect_scene_change",
+        "Detect scene changes in MP4 files and generate LLC files",
+    ),
+    "empty-mp4s": ("empty_mp4s", "Zero out mp4 files"),
+    "find-duplicate-files": (
+        "find_duplicate_files",
+        "Find duplicate files by content",
+    ),
+    "find-duplicate-lines": (
+        "find_duplicates_in_txt",
+        "Find duplicate or near-duplicate lines in text files",
+    ),
+    "find-folders-without": (
+        "find_folders_without_extension",
+        "List subfolders without files of given extensions",
+    ),
+    "fs-index": ("fs_index", "Create or refresh a filesystem metadata index"),
+    "javguru-extract-ids": (
+        "javguru_extract_ids_from_txt",
+        "Extract ids from '[ID] description.mp4' listings",
+    ),
+    "javguru-lookup": (
+        "javguru_lookup_ids",
+        "Bulk lookup of ids: which are new, existing and rated",
+    ),
+    "javguru-ratings": (
+        "javguru_ratings",
+        "Bulk import ratings/comments, or export the database",
+    ),
+    "javguru-update-db": ("javguru_update_db", "Insert or sync javguru database rows"),
+    "list-files": ("list_files_with_extension", "List files with a given extension"),
+    "manga-to-cbz": (
+        "convert_manga_library_to_cbz",
+        "Convert manga chapter folders to CBZ",
+    ),
+    "radio-caprice": ("radio_caprice_m3u", "Make M3U playlists of Caprice radios"),
+}
+
+
+def main(argv: list[str] | None = None):
+    width = max(map(len, COMMANDS))
+    parser = argparse.ArgumentParser(
+        prog="scripts",
+        description="A collection of various scripts",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="commands:\n"
+        + "\n".join(
+            f"  {name:<{width}}  {description}"
+            for name, (_, description) in COMMANDS.items()
+        )
+        + "\n\nRun 'scripts COMMAND --help' for the options of a command.",
+    )
+    parser.add_argument("command", choices=COMMANDS, metavar="COMMAND")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    module = importlib.import_module(COMMANDS[args.command][0])
+    # The scripts parse sys.argv themselves
+    sys.argv = [f"scripts {args.command}", *args.args]
+    return module.main()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,7 +2,7 @@ import argparse
 import zipfile
 from pathlib import Path
 
-from send2trash import send2trash
+from instrumentation import count, instrumented, phase
 
 
 def convert_to_cbz(manga_root_path, delete_original=False):
@@ -51,7 +51,10 @@ def convert_to_cbz(manga_root_path, delete_original=False):
                 continue
 
             # Create CBZ file
-            with zipfile.ZipFile(cbz_path, "w", zipfile.ZIP_DEFLATED) as cbz_file:
+            with (
+                phase("zip"),
+                zipfile.ZipFile(cbz_path, "w", zipfile.ZIP_DEFLATED) as cbz_file,
+            ):
                 for img_file in image_files:
                     # Preserve folder structure inside CBZ if needed
                     arcname = img_file.name
@@ -59,10 +62,15 @@ def convert_to_cbz(manga_root_path, delete_original=False):
                     print(f"  Added: {img_file.name}")
 
             print(f"  Created: {cbz_path.name}")
+            count("chapters")
+            count("images", len(image_files))
 
             # Delete original folder if requested
             if delete_original:
-                send2trash(item)
+                from send2trash import send2trash
+
+                with phase("trash"):
+                    send2trash(item)
                 print(f"  Deleted original folder: {item.name}")
 
 
@@ -80,7 +88,8 @@ def batch_convert_all_manga(manga_library_path, delete_original=False):
             convert_to_cbz(manga_folder, delete_original=delete_original)
 
 
-if __name__ == "__main__":
+@instrumented("convert_manga_library_to_cbz")
+def main():
     parser = argparse.ArgumentParser(description="Convert manga chapters to CBZ format")
     parser.add_argument("path", help="Path to manga folder or library")
     parser.add_argument(
@@ -96,3 +105,7 @@ if __name__ == "__main__":
         batch_convert_all_manga(args.path, delete_original=args.delete)
     else:
         convert_to_cbz(args.path, delete_original=args.delete)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,8 @@ import subprocess
 from pathlib import Path
 from typing import Callable, Optional
 
+from instrumentation import count, instrumented, phase
+
 
 class DetectedSegment:
     def __init__(self, start: float, end: float):
@@ -146,6 +148,7 @@ def make_llc_file_name(mp4_path: Path) -> str:
     return f"{mp4_path.stem}.llc"
 
 
+@instrumented("detect_scene_change")
 def main():
     parser = argparse.ArgumentParser(
         description="Detect scene changes in MP4 files and generate LLC files"
@@ -187,12 +190,15 @@ def main():
         llc_path = file_path.parent / make_llc_file_name(file_path)
 
         print(f"Processing: {file_path}")
-        segments = detect_scene_changes_sync(
-            file_path=str(file_path),
-            min_change=min_change,
-            on_segment_detected=segment_callback,
-        )
+        with phase("detect"):
+            segments = detect_scene_changes_sync(
+                file_path=str(file_path),
+                min_change=min_change,
+                on_segment_detected=segment_callback,
+            )
         print(f"Detected {len(segments)} segments")
+        count("files")
+        count("segments", len(segments))
 
         llc = export_to_llc(segments, file_path.name)
         llc_path.write_text(json.dumps(llc, indent=2))
@@ -1,30 +1,104 @@
-from genericpath import isfile
+import argparse
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import sys
 import time
 
+from instrumentation import count, instrumented, phase
+
+
 def check_yes(answer: str):
     if answer.lower() != "y":
         print("Cancelled")
         sys.exit(0)
 
 
-cwd = Path(os.getcwd())
-
-files = [file for file in cwd.iterdir() if file.is_file() and file.suffix == ".mp4"]
+def find_mp4s(directory: Path, recursive: bool) -> list[Path]:
+    pattern = "**/*" if recursive else "*"
+    return [file for file in directory.glob(pattern) if file.is_file() and file.suffix == ".mp4"]
 
-files_str = "\n".join((str(f) for f in files))
-answer = input(f"{len(files)} mp4 files will be zeroed:\n{files_str}\n\nProceed? y/n: ")
-check_yes(answer)
 
-while True:
+def truncate(file: Path) -> Exception | None:
     try:
-        for file in files:
-            file.write_bytes(b'')
-
-        print("Done")
-        break
+        os.truncate(file, 0)
     except Exception as e:
-        print(f"Error occured: {e}, retrying in a while...")
-        time.sleep(5)
\ No newline at end of file
+        return e
+    return None
+
+
+def empty_files(
+    files: list[Path],
+    workers: int = 8,
+    deadline: float = 300,
+    initial_delay: float = 1,
+    max_delay: float = 30,
+) -> dict[Path, Exception]:
+    """
+    Truncate files in parallel, then retry only the ones that failed (e.g. locked by a player)
+    with exponential backoff until they all succeed or the deadline in seconds passes.
+
+    Returns the files that still failed with their last error.
+    """
+    give_up_at = time.monotonic() + deadline
+    delay = initial_delay
+    failed: dict[Path, Exception] = {}
+    remaining = files
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            errors = executor.map(truncate, remaining)
+            failed = {file: e for file, e in zip(remaining, errors) if e is not None}
+            print(f"Zeroed {len(remaining) - len(failed)} of {len(remaining)}")
+            count("zeroed", len(remaining) - len(failed))
+            if not failed:
+                break
+
+            for file, e in failed.items():
+                print(f"Error occured for {file}: {e}")
+            if time.monotonic() + delay > give_up_at:
+                break
+
+            print(f"Retrying {len(failed)} files in {delay:g}s...")
+            time.sleep(delay)
+            count("retries")
+            delay = min(delay * 2, max_delay)
+            remaining = list(failed)
+
+    return failed
+
+
+@instrumented("empty_mp4s")
+def main():
+    parser = argparse.ArgumentParser(description="Zero out mp4 files")
+    parser.add_argument("directory", nargs="?", default=os.getcwd(), help="Default: current directory")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Include subdirectories")
+    parser.add_argument("-n", "--dry-run", action="store_true", help="Only list the files")
+    parser.add_argument("--deadline", type=float, default=300, help="Give up retrying after this many seconds (default: 300)")
+    parser.add_argument("-j", "--workers", type=int, default=8, help="Files truncated in parallel (default: 8)")
+    args = parser.parse_args()
+
+    with phase("find"):
+        files = find_mp4s(Path(args.directory), args.recursive)
+
+    files_str = "\n".join((str(f) for f in files))
+    if args.dry_run:
+        print(f"{len(files)} mp4 files would be zeroed:\n{files_str}")
+        return
+
+    answer = input(f"{len(files)} mp4 files will be zeroed:\n{files_str}\n\nProceed? y/n: ")
+    check_yes(answer)
+
+    with phase("truncate"):
+        failed = empty_files(files, max(args.workers, 1), args.deadline)
+    if failed:
+        print(f"Gave up on {len(failed)} files:")
+        for file in failed:
+            print(file)
+        sys.exit(1)
+
+    print("Done")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Find duplicate files by content, reading as little as possible.
+
+Files are found with the list_files_with_extension walker, without following
+symlinks, and grouped by size first. Only files sharing a size get a quick hash of
+their first and last blocks, and only files whose quick hashes collide are hashed in
+full. Hashing runs on a thread pool,
+and with --cache the hashes are kept in SQLite, so an interrupted or repeated scan
+only hashes new or modified files.
+"""
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from instrumentation import count, instrumented, phase
+from list_files_with_extension import iter_file_entries
+
+BLOCK_SIZE = 64 * 1024
+READ_SIZE = 1024 * 1024
+DEFAULT_WORKERS = 8
+COMMIT_EVERY = 200
+
+
+def quick_hash(path, size):
+    """Hash of the first and last block, the whole content for small files"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as file:
+        digest.update(file.read(BLOCK_SIZE))
+        if size > BLOCK_SIZE:
+            file.seek(max(size - BLOCK_SIZE, BLOCK_SIZE))
+            digest.update(file.read(BLOCK_SIZE))
+    return digest.hexdigest()
+
+
+def full_hash(path, size):
+    digest = hashlib.blake2b(digest_size=32)
+    with open(path, "rb") as file:
+        while chunk := file.read(READ_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class HashCache:
+    """Hashes keyed by path and kind, valid while size and mtime are unchanged"""
+
+    def __init__(self, db_path=":memory:"):
+        self.conn = sqlite3.connect(db_path)
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS hashes (
+                    path TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    digest TEXT NOT NULL,
+                    PRIMARY KEY (path, kind)
+                )
+            """)
+        self.pending_writes = 0
+
+    def get(self, path, kind, size, mtime_ns):
+        row = self.conn.execute(
+            "SELECT digest FROM hashes WHERE path = ? AND kind = ? AND size = ? AND mtime_ns = ?",
+            (path, kind, size, mtime_ns),
+        ).fetchone()
+        return row[0] if row else None
+
+    def put(self, path, kind, size, mtime_ns, digest):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO hashes (path, kind, size, mtime_ns, digest) VALUES (?, ?, ?, ?, ?)",
+            (path, kind, size, mtime_ns, digest),
+        )
+        # Commit regularly so an interrupted scan can resume
+        self.pending_writes += 1
+        if self.pending_writes >= COMMIT_EVERY:
+            self.commit()
+
+    def commit(self):
+        self.conn.commit()
+        self.pending_writes = 0
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+
+def _hash_files(files, kind, cache, executor, stats):
+    """
+    Hash (path, size, mtime_ns) files with the given kind, using the cache where possible.
+
+    All files are submitted before any result is collected, so the whole pool is busy
+    however small the groups of equal size are.
+
+    Returns:
+        dict: Lists of files keyed by (size, digest)
+    """
+    hash_func = quick_hash if kind == "quick" else full_hash
+    by_digest = {}
+    count(f"{kind}_hashes", len(files))
+    futures = {}
+    for file in files:
+        path, size, mtime_ns = file
+        digest = cache.get(path, kind, size, mtime_ns)
+        if digest is not None:
+            by_digest.setdefault((size, digest), []).append(file)
+            count(f"{kind}_hash_cache_hits")
+        else:
+            futures[executor.submit(hash_func, path, size)] = file
+
+    for future in as_completed(futures):
+        file = futures[future]
+        path, size, mtime_ns = file
+        try:
+            digest = future.result()
+        except OSError as e:
+            print(f"Warning: can't read {path}: {e}", file=sys.stderr)
+            continue
+        stats["bytes_read"] += size if kind == "full" else min(size, 2 * BLOCK_SIZE)
+        cache.put(path, kind, size, mtime_ns, digest)
+        by_digest.setdefault((size, digest), []).append(file)
+
+    return by_digest
+
+
+def find_duplicate_files(
+    directory,
+    extensions=None,
+    max_depth=0,
+    min_size=1,
+    workers=DEFAULT_WORKERS,
+    cache_path=None,
+):
+    """
+    Find groups of files with identical content.
+
+    Returns:
+        tuple: (list of duplicate groups as sorted path lists, stats dict with
+            files, total_bytes and bytes_read)
+    """
+    stats = {"files": 0, "total_bytes": 0, "bytes_read": 0}
+
+    by_size = {}
+    # Hard links of one file are the same content on disk, not duplicates
+    inodes = set()
+    with phase("walk"):
+        for entry in iter_file_entries(
+            directory, extensions, max_depth, workers, follow_symlinks=False
+        ):
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except OSError as e:
+                print(f"Warning: can't stat {entry.path}: {e}", file=sys.stderr)
+                continue
+            if stat.st_size < min_size:
+                continue
+            # st_ino is 0 where DirEntry doesn't provide it (Windows)
+            if stat.st_ino:
+                if (stat.st_dev, stat.st_ino) in inodes:
+                    continue
+                inodes.add((stat.st_dev, stat.st_ino))
+            stats["files"] += 1
+            stats["total_bytes"] += stat.st_size
+            by_size.setdefault(stat.st_size, []).append(
+                (entry.path, stat.st_size, stat.st_mtime_ns)
+            )
+
+    cache = HashCache(cache_path or ":memory:")
+    groups = []
+    try:
+        with phase("hash"), ThreadPoolExecutor(max_workers=workers) as executor:
+            candidates = [
+                file for files in by_size.values() if len(files) > 1 for file in files
+            ]
+            collisions = []
+            for (size, _), quick_group in _hash_files(
+                candidates, "quick", cache, executor, stats
+            ).items():
+                if len(quick_group) < 2:
+                    continue
+                # The quick hash already covered the whole content
+                if size <= 2 * BLOCK_SIZE:
+                    groups.append(sorted(path for path, _, _ in quick_group))
+                else:
+                    collisions.extend(quick_group)
+
+            for full_group in _hash_files(
+                collisions, "full", cache, executor, stats
+            ).values():
+                if len(full_group) > 1:
+                    groups.append(sorted(path for path, _, _ in full_group))
+    finally:
+        cache.close()
+
+    groups.sort()
+    count("bytes_read", stats["bytes_read"])
+    return groups, stats
+
+
+@instrumented("find_duplicate_files")
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("directory", help="Directory to search in")
+    parser.add_argument(
+        "extensions",
+        nargs="*",
+        help="File extensions to consider (without dot), all files if none given",
+    )
+    parser.add_argument(
+        "-d",
+        "--depth",
+        type=int,
+        default=sys.maxsize,
+        help="Subfolder depth (0=current dir only). Default: unlimited",
+    )
+    parser.add_argument(
+        "--min-size",
+        type=int,
+        default=1,
+        help="Ignore files smaller than this many bytes (default: 1, skips empty files)",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"Parallel listing and hashing threads (default: {DEFAULT_WORKERS})",
+    )
+    parser.add_argument(
+        "--cache", metavar="DB", help="Hash cache database, makes rescans incremental"
+    )
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        print(f"Error: '{args.directory}' is not a directory", file=sys.stderr)
+        sys.exit(1)
+
+    groups, stats = find_duplicate_files(
+        args.directory,
+        [extension.lstrip(".") for extension in args.extensions] or None,
+        args.depth,
+        args.min_size,
+        max(args.workers, 1),
+        args.cache,
+    )
+
+    for group in groups:
+        print(f"{os.path.getsize(group[0])} bytes, {len(group)} copies:")
+        for path in group:
+            print(f"  {path}")
+
+    total_mb = stats["total_bytes"] / 1024 / 1024
+    read_mb = stats["bytes_read"] / 1024 / 1024
+    print(
+        f"\n{len(groups)} duplicate groups in {stats['files']} files, "
+        f"read {read_mb:.1f} MB of {total_mb:.1f} MB",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
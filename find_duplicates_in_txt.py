@@ -1,4 +1,39 @@
+import argparse
+import bisect
+import hashlib
+import heapq
+import mmap
+import operator
+import os
+import re
+import sqlite3
 import sys
+import tempfile
+import zlib
+from collections import Counter, deque
+from itertools import groupby, repeat
+from pathlib import Path
+
+from instrumentation import instrumented, phase
+
+# Rough per distinct line cost of the counting dict on top of the string itself
+ENTRY_OVERHEAD = 120
+PARTITION_BITS = 6
+PARTITIONS = 1 << PARTITION_BITS
+# Every level takes its own PARTITION_BITS of the 64-bit str hash
+MAX_SPILL_DEPTH = 64 // PARTITION_BITS - 1
+MIN_CHUNK_SIZE = 1024 * 1024
+# A worker holds its chunk decoded and split at once, a few times the chunk size
+MAX_CHUNK_SIZE = 32 * 1024 * 1024
+
+NORMALIZATIONS = ("case", "punct", "space")
+PUNCTUATION_RE = re.compile(r"[^\w\s]")
+WHITESPACE_RE = re.compile(r"\s+")
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+MASK64 = (1 << 64) - 1
+MAX_BIN_VALUE = 1 << 48
+EMPTY_BIN = MASK64
+MAX_BUCKET_LEADERS = 16
 
 
 def find_duplicate_lines(filename):
@@ -29,16 +64,677 @@ def find_duplicate_lines(filename):
         return {}
 
 
+def _split_at_newlines(filename, chunks):
+    """
+    Split the file into about `chunks` byte ranges, each ending right after a newline.
+    Ranges are at most about MAX_CHUNK_SIZE, so large files get more of them.
+    """
+    size = os.path.getsize(filename)
+    if size == 0:
+        return []
+
+    step = min(max(size // chunks, MIN_CHUNK_SIZE), MAX_CHUNK_SIZE)
+    ranges = []
+    with open(filename, "rb") as file, mmap.mmap(
+        file.fileno(), 0, access=mmap.ACCESS_READ
+    ) as data:
+        start = 0
+        while start < size:
+            newline = data.find(b"\n", min(start + step, size) - 1)
+            end = size if newline == -1 else newline + 1
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _count_chunk(filename, start, end):
+    """Count non-empty stripped lines of one chunk, in order of first appearance"""
+    with open(filename, "rb") as file, mmap.mmap(
+        file.fileno(), 0, access=mmap.ACCESS_READ
+    ) as data:
+        text = data[start:end].decode("utf-8")
+    # Same line breaks as reading the file in text mode (universal newlines)
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return Counter(filter(None, map(str.strip, text.split("\n"))))
+
+
+def find_duplicate_lines_parallel(filename, workers=None):
+    """
+    Find duplicate lines like find_duplicate_lines, counting newline-aligned chunks
+    of the memory-mapped file in worker processes and merging the partial counts.
+    """
+    try:
+        workers = workers or os.cpu_count() or 1
+        ranges = _split_at_newlines(filename, workers * 4)
+        starts = [start for start, _ in ranges]
+        ends = [end for _, end in ranges]
+
+        line_counts = Counter()
+        if workers == 1:
+            for partial in map(_count_chunk, repeat(filename), starts, ends):
+                line_counts.update(partial)
+        else:
+            # Imported here, multiprocessing is slow to import for the other modes
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # Partial counts are merged in file order to keep first appearance
+                # order. Only a few chunks per worker are in flight, so finished
+                # partial counts don't pile up waiting for an earlier slow one
+                in_flight = deque()
+                for start, end in zip(starts, ends):
+                    in_flight.append(
+                        executor.submit(_count_chunk, filename, start, end)
+                    )
+                    if len(in_flight) >= workers * 2:
+                        line_counts.update(in_flight.popleft().result())
+                while in_flight:
+                    line_counts.update(in_flight.popleft().result())
+
+        return {line: count for line, count in line_counts.items() if count > 1}
+
+    except FileNotFoundError:
+        print(f"Error: File '{filename}' not found.")
+        return {}
+    except Exception as e:
+        print(f"Error reading file: {e}")
+        return {}
+
+
+def _write_record(file, index, count, line):
+    file.write(f"{index}\t{count}\t{line}\n")
+
+
+def _read_records(path):
+    with open(path, "r", encoding="utf-8", newline="\n") as file:
+        for record in file:
+            index, count, line = record[:-1].split("\t", 2)
+            yield int(index), int(count), line
+
+
+def _count_records(records, memory_budget, temp_dir, depth, out):
+    """
+    Count (first index, count, line) records, which must arrive in ascending index order.
+    Duplicates are written to out sorted by first index. When the distinct lines don't fit
+    in memory_budget, they are spilled into hashed partitions which are counted one by one.
+    """
+    counts = {}
+    used = 0
+    records = iter(records)
+    for index, count, line in records:
+        entry = counts.get(line)
+        if entry is not None:
+            entry[1] += count
+            continue
+
+        counts[line] = [index, count]
+        used += sys.getsizeof(line) + ENTRY_OVERHEAD
+        if used > memory_budget:
+            if depth >= MAX_SPILL_DEPTH:
+                raise MemoryError(
+                    f"distinct lines still exceed the memory budget after {MAX_SPILL_DEPTH} levels of spilling"
+                )
+            _spill(counts, records, memory_budget, temp_dir, depth, out)
+            return
+
+    duplicates = sorted(
+        (index, line, count) for line, (index, count) in counts.items() if count > 1
+    )
+    del counts
+    for index, line, count in duplicates:
+        _write_record(out, index, count, line)
+
+
+def _partition(line, depth):
+    # Other bits of the hash at every depth, a partition spread again over all of them
+    return (hash(line) >> (PARTITION_BITS * depth)) % PARTITIONS
+
+
+def _spill(counts, records, memory_budget, temp_dir, depth, out):
+    spill_dir = Path(tempfile.mkdtemp(dir=temp_dir))
+    partition_paths = [spill_dir / f"partition_{i}.txt" for i in range(PARTITIONS)]
+    partitions = [
+        open(path, "w", encoding="utf-8", newline="\n") for path in partition_paths
+    ]
+    try:
+        # Everything counted so far precedes the remaining records, so each partition
+        # keeps ascending index order
+        for line, (index, count) in counts.items():
+            _write_record(partitions[_partition(line, depth)], index, count, line)
+        counts.clear()
+        for index, count, line in records:
+            _write_record(partitions[_partition(line, depth)], index, count, line)
+    finally:
+        for partition in partitions:
+            partition.close()
+
+    result_paths = []
+    for path in partition_paths:
+        result_path = path.with_suffix(".dups")
+        with open(result_path, "w", encoding="utf-8", newline="\n") as partition_out:
+            _count_records(
+                _read_records(path), memory_budget, temp_dir, depth + 1, partition_out
+            )
+        path.unlink()
+        result_paths.append(result_path)
+
+    # Merged level by level, so no more than PARTITIONS result files are open at once
+    for index, count, line in heapq.merge(*map(_read_records, result_paths)):
+        _write_record(out, index, count, line)
+    for result_path in result_paths:
+        result_path.unlink()
+    spill_dir.rmdir()
+
+
+def find_duplicate_lines_external(filename, memory_budget, temp_dir=None):
+    """
+    Find duplicate lines like find_duplicate_lines, streaming the file and spilling
+    to temporary files once the distinct lines take more than memory_budget bytes.
+    Spills go to temp_dir, default the system temporary directory, which may be
+    RAM backed (tmpfs).
+
+    Unlike find_duplicate_lines, errors are raised, a partial result would look like
+    no duplicates.
+
+    Yields:
+        tuple: (line, count) pairs in order of first appearance, same as find_duplicate_lines
+    """
+    with tempfile.TemporaryDirectory(
+        prefix="find_duplicates_", dir=temp_dir
+    ) as temp_dir:
+        with open(filename, "r", encoding="utf-8") as file:
+            records = (
+                (index, 1, line)
+                for index, line in enumerate(line.strip() for line in file)
+                if line
+            )
+            top_path = Path(temp_dir) / "top.dups"
+            with open(top_path, "w", encoding="utf-8", newline="\n") as out:
+                _count_records(records, memory_budget, temp_dir, 0, out)
+
+        for _, count, line in _read_records(top_path):
+            yield line, count
+
+
+def normalize_line(line, normalize=NORMALIZATIONS, strip_suffix=None):
+    """
+    Normalize a line for near-duplicate comparison.
+
+    Args:
+        normalize: Any of "case", "punct" and "space" to ignore case, punctuation
+            and whitespace differences
+        strip_suffix: Optional compiled regex, its first match is removed from the line
+    """
+    if strip_suffix is not None:
+        line = strip_suffix.sub("", line, count=1)
+    if "case" in normalize:
+        line = line.casefold()
+    if "punct" in normalize:
+        line = PUNCTUATION_RE.sub(" ", line)
+    if "space" in normalize:
+        line = WHITESPACE_RE.sub(" ", line).strip()
+    return line
+
+
+def minhash_signature(text, num_perm=64, shingle_size=3):
+    """
+    One-permutation MinHash of the character shingles of text: every shingle is hashed
+    once into one of num_perm bins keeping the minimum, empty bins borrow from the next
+    non-empty bin. Equal bins between two signatures estimate their Jaccard similarity.
+    """
+    signature = [EMPTY_BIN] * num_perm
+    for i in range(max(len(text) - shingle_size + 1, 1)):
+        h = (zlib.crc32(text[i : i + shingle_size].encode()) * HASH_MULTIPLIER) & MASK64
+        index, value = divmod(h, MAX_BIN_VALUE)
+        index %= num_perm
+        if value < signature[index]:
+            signature[index] = value
+
+    filled = [i for i, value in enumerate(signature) if value != EMPTY_BIN]
+    for i, value in enumerate(signature):
+        if value == EMPTY_BIN:
+            source = filled[bisect.bisect(filled, i) % len(filled)]
+            signature[i] = signature[source] + (source - i) % num_perm * MAX_BIN_VALUE
+    return signature
+
+
+def _lsh_bands(num_perm, threshold):
+    """Pick rows per band so that the LSH S-curve crosses threshold the closest"""
+    rows = min(
+        (r for r in range(1, num_perm + 1) if num_perm % r == 0),
+        key=lambda r: abs((r / num_perm) ** (1 / r) - threshold),
+    )
+    return num_perm // rows, rows
+
+
+def _similarity(a, b):
+    return sum(map(operator.eq, a, b)) / len(a)
+
+
+def find_near_duplicate_lines(
+    filename,
+    threshold=0.8,
+    normalize=NORMALIZATIONS,
+    strip_suffix=None,
+    num_perm=64,
+    shingle_size=3,
+):
+    """
+    Find clusters of similar lines using MinHash signatures and locality-sensitive hashing.
+    Lines are stripped and empty ones skipped as in find_duplicate_lines, then normalized;
+    lines with the same normalized form always share a cluster.
+
+    Returns:
+        list: Clusters as lists of distinct original lines, each in order of first appearance
+    """
+    try:
+        # Distinct original lines grouped by normalized form
+        groups = {}
+        with open(filename, "r", encoding="utf-8") as file:
+            for line in file:
+                line = line.strip()
+                if not line:
+                    continue
+                key = normalize_line(line, normalize, strip_suffix)
+                originals = groups.setdefault(key, {})
+                originals.setdefault(line, None)
+    except FileNotFoundError:
+        print(f"Error: File '{filename}' not found.")
+        return []
+    except Exception as e:
+        print(f"Error reading file: {e}")
+        return []
+
+    keys = list(groups)
+    with phase("minhash"):
+        signatures = [minhash_signature(key, num_perm, shingle_size) for key in keys]
+
+    parents = list(range(len(keys)))
+
+    def find(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    bands, rows = _lsh_bands(num_perm, threshold)
+    with phase("lsh"):
+        for band in range(bands):
+            buckets = {}
+            for i, signature in enumerate(signatures):
+                band_key = tuple(signature[band * rows : (band + 1) * rows])
+                buckets.setdefault(band_key, []).append(i)
+
+            for members in buckets.values():
+                # Greedy leader clustering inside the bucket, a member joins the
+                # first leader it is similar enough to. Only the latest leaders are
+                # tried, which keeps buckets of many dissimilar lines from going
+                # quadratic
+                leaders = []
+                for i in members:
+                    for leader in leaders[-MAX_BUCKET_LEADERS:]:
+                        if find(i) == find(leader):
+                            break
+                        if _similarity(signatures[i], signatures[leader]) >= threshold:
+                            parents[find(i)] = find(leader)
+                            break
+                    else:
+                        leaders.append(i)
+
+    clusters = {}
+    for i, key in enumerate(keys):
+        clusters.setdefault(find(i), []).extend(groups[key])
+
+    return [lines for lines in clusters.values() if len(lines) > 1]
+
+
+def _line_hash(line: str) -> int:
+    digest = hashlib.blake2b(line.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+class LineHashIndex:
+    """
+    Persistent SQLite index of line hashes with their file:line locations.
+    Files are only re-hashed when their size or modification time changed.
+    """
+
+    def __init__(self, db_path=":memory:"):
+        self.conn = sqlite3.connect(db_path)
+        self._init_db()
+
+    def _init_db(self):
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    id INTEGER PRIMARY KEY,
+                    path TEXT NOT NULL UNIQUE,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS lines (
+                    hash INTEGER NOT NULL,
+                    file_id INTEGER NOT NULL REFERENCES files (id),
+                    line_no INTEGER NOT NULL,
+                    offset INTEGER NOT NULL
+                )
+            """)
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS lines_hash ON lines (hash)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS lines_file_id ON lines (file_id)"
+            )
+
+    def _remove_file(self, file_id):
+        self.conn.execute("DELETE FROM lines WHERE file_id = ?", (file_id,))
+        self.conn.execute("DELETE FROM files WHERE id = ?", (file_id,))
+
+    def add_file(self, filename) -> bool:
+        """
+        Hash the non-empty stripped lines of a file into the index.
+
+        Returns:
+            bool: False if the file was already indexed and hasn't changed since
+        """
+        path = os.path.abspath(filename)
+        stat = os.stat(path)
+        row = self.conn.execute(
+            "SELECT id, size, mtime_ns FROM files WHERE path = ?", (path,)
+        ).fetchone()
+        if row is not None and row[1:] == (stat.st_size, stat.st_mtime_ns):
+            return False
+
+        with self.conn:
+            if row is not None:
+                self._remove_file(row[0])
+            file_id = self.conn.execute(
+                "INSERT INTO files (path, size, mtime_ns) VALUES (?, ?, ?)",
+                (path, stat.st_size, stat.st_mtime_ns),
+            ).lastrowid
+            self.conn.executemany(
+                "INSERT INTO lines (hash, file_id, line_no, offset) VALUES (?, ?, ?, ?)",
+                (
+                    (_line_hash(line), file_id, line_no, offset)
+                    for line_no, offset, line in self._iter_lines(path)
+                ),
+            )
+        return True
+
+    @staticmethod
+    def _iter_lines(path):
+        with open(path, "rb") as file:
+            offset = 0
+            for line_no, raw in enumerate(file, start=1):
+                line = raw.decode("utf-8").strip()
+                if line:
+                    yield line_no, offset, line
+                offset += len(raw)
+
+    def refresh_indexed_files(self) -> tuple[list[str], list[str]]:
+        """
+        Re-hash every indexed file whose size or modification time changed, and drop
+        files that no longer exist or can't be read, so no stale offsets are reported.
+
+        Returns:
+            tuple: (removed paths, re-hashed paths)
+        """
+        removed = []
+        rehashed = []
+        for file_id, path in self.conn.execute("SELECT id, path FROM files").fetchall():
+            try:
+                if self.add_file(path):
+                    rehashed.append(path)
+            except (OSError, UnicodeDecodeError):
+                with self.conn:
+                    self._remove_file(file_id)
+                removed.append(path)
+        return removed, rehashed
+
+    @staticmethod
+    def _read_lines(path, offsets):
+        """Stripped lines at the offsets of a file, None for those that can't be read"""
+        try:
+            with open(path, "rb") as file:
+                lines = []
+                for offset in offsets:
+                    file.seek(offset)
+                    try:
+                        lines.append(file.readline().decode("utf-8").strip())
+                    except UnicodeDecodeError:
+                        lines.append(None)
+                return lines
+        except OSError:
+            return [None] * len(offsets)
+
+    def duplicates(self):
+        """
+        Yields:
+            tuple: (line, [(path, line_no), ...]) for every line found more than once
+                across all indexed files, ordered by first location
+        """
+        rows = self.conn.execute("""
+            SELECT lines.hash, files.path, lines.line_no, lines.offset
+            FROM lines
+            JOIN files ON files.id = lines.file_id
+            WHERE lines.hash IN (
+                SELECT hash FROM lines GROUP BY hash HAVING COUNT(*) > 1
+            )
+            ORDER BY lines.hash, files.path, lines.line_no
+        """)
+        groups = []
+        stale = set()
+        for line_hash, group in groupby(rows, key=operator.itemgetter(0)):
+            # Read every location back, a file changed without a new size or mtime
+            # no longer has the indexed line at the stored offset
+            line = None
+            locations = []
+            for path, path_group in groupby(group, key=operator.itemgetter(1)):
+                path_group = list(path_group)
+                texts = self._read_lines(path, [offset for *_, offset in path_group])
+                for (_, _, line_no, _), text in zip(path_group, texts):
+                    if text is not None and _line_hash(text) == line_hash:
+                        line = text
+                        locations.append((path, line_no))
+                    else:
+                        stale.add(path)
+            if len(locations) > 1:
+                groups.append((line, locations))
+
+        # An impossible size makes refresh_indexed_files hash them again next run
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE files SET size = -1 WHERE path = ?",
+                ((path,) for path in stale),
+            )
+        for path in sorted(stale):
+            print(
+                f"Warning: {path} changed since it was indexed, skipped its stale lines",
+                file=sys.stderr,
+            )
+
+        groups.sort(key=lambda group: group[1][0])
+        yield from groups
+
+    def close(self):
+        self.conn.close()
+
+
+def find_cross_file_duplicates(filenames, index_path):
+    index = LineHashIndex(index_path)
+    try:
+        with phase("index"):
+            removed, rehashed = index.refresh_indexed_files()
+        for path in removed:
+            print(f"Removed from index: {path}")
+        for path in rehashed:
+            print(f"Re-indexed changed file: {path}")
+        for filename in filenames:
+            try:
+                with phase("index"):
+                    added = index.add_file(filename)
+                if added:
+                    print(f"Indexed: {filename}")
+            except FileNotFoundError:
+                print(f"Error: File '{filename}' not found.")
+            except Exception as e:
+                print(f"Error reading file '{filename}': {e}")
+
+        found = False
+        for line, locations in index.duplicates():
+            if not found:
+                print("\nDuplicate lines found:")
+                print("-" * 40)
+                found = True
+            print(f"'{line}' - appears {len(locations)} times")
+            for path, line_no in locations:
+                print(f"    {path}:{line_no}")
+
+        if not found:
+            print("No duplicate lines found.")
+    finally:
+        index.close()
+
+
+@instrumented("find_duplicates_in_txt")
 def main():
-    filename = sys.argv[1]
-    duplicates = find_duplicate_lines(filename)
+    parser = argparse.ArgumentParser(
+        description="Find duplicate lines in text files (case-sensitive)"
+    )
+    parser.add_argument(
+        "filenames",
+        nargs="+",
+        metavar="filename",
+        help="Text file to search, several files are searched across each other",
+    )
+    parser.add_argument(
+        "--index",
+        metavar="DB",
+        help="Persistent line hash index: only new or changed files are hashed, duplicates are reported across every indexed file",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=int,
+        metavar="MB",
+        help="Stream the file and spill to temporary files above this many megabytes",
+    )
+    parser.add_argument(
+        "--temp-dir",
+        metavar="DIR",
+        help="With --memory-budget, directory for the spill files (default: the system temporary directory, often RAM backed)",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        nargs="?",
+        const=0,
+        metavar="N",
+        help="Count memory-mapped chunks in N worker processes (default N: all cores)",
+    )
+    parser.add_argument(
+        "--near",
+        type=float,
+        nargs="?",
+        const=0.8,
+        metavar="THRESHOLD",
+        help="Find clusters of similar lines instead, with estimated Jaccard similarity of at least THRESHOLD (default: 0.8)",
+    )
+    parser.add_argument(
+        "--normalize",
+        default=",".join(NORMALIZATIONS),
+        help="With --near, comma separated differences to ignore: case, punct, space (default: all, '' for none)",
+    )
+    parser.add_argument(
+        "--strip-suffix",
+        metavar="REGEX",
+        help=r"With --near, remove this regex from lines before comparing, e.g. '\s*\(\d+\)$'",
+    )
+    args = parser.parse_args()
 
-    if duplicates:
-        print("\nDuplicate lines found:")
-        print("-" * 40)
-        for line, count in duplicates.items():
-            print(f"'{line}' - appears {count} times")
+    normalize = tuple(filter(None, map(str.strip, args.normalize.split(","))))
+    unknown = [name for name in normalize if name not in NORMALIZATIONS]
+    if unknown:
+        parser.error(
+            f"unknown --normalize value {', '.join(unknown)}, choose from {', '.join(NORMALIZATIONS)}"
+        )
+    if args.near is not None and not 0 < args.near <= 1:
+        parser.error("--near THRESHOLD must be greater than 0 and at most 1")
+
+    # Each of these is a mode of its own for a single file
+    modes = [
+        option
+        for option, value in (
+            ("--near", args.near),
+            ("-j/--workers", args.workers),
+            ("--memory-budget", args.memory_budget),
+        )
+        if value is not None
+    ]
+    if modes and (args.index or len(args.filenames) > 1):
+        parser.error(
+            f"{modes[0]} works on a single file, not with --index or several files"
+        )
+    if len(modes) > 1:
+        parser.error(f"{modes[0]} and {modes[1]} can't be combined")
+
+    if args.index or len(args.filenames) > 1:
+        find_cross_file_duplicates(args.filenames, args.index or ":memory:")
+        return
+
+    filename = args.filenames[0]
+
+    if args.near is not None:
+        clusters = find_near_duplicate_lines(
+            filename,
+            threshold=args.near,
+            normalize=normalize,
+            strip_suffix=re.compile(args.strip_suffix) if args.strip_suffix else None,
+        )
+        if not clusters:
+            print("No near-duplicate lines found.")
+            return
+
+        print("\nNear-duplicate lines found:")
+        for cluster in clusters:
+            print("-" * 40)
+            for line in cluster:
+                print(f"'{line}'")
+        return
+
+    if args.workers is not None:
+        with phase("count"):
+            duplicates = find_duplicate_lines_parallel(
+                filename, args.workers or None
+            ).items()
+    elif args.memory_budget:
+        # A generator, its counting happens while printing
+        duplicates = find_duplicate_lines_external(
+            filename, args.memory_budget * 1024 * 1024, args.temp_dir
+        )
     else:
+        with phase("count"):
+            duplicates = find_duplicate_lines(filename).items()
+
+    found = False
+    try:
+        for line, count in duplicates:
+            if not found:
+                print("\nDuplicate lines found:")
+                print("-" * 40)
+                found = True
+            print(f"'{line}' - appears {count} times")
+    except FileNotFoundError:
+        print(f"Error: File '{filename}' not found.")
+        sys.exit(1)
+    except (OSError, UnicodeDecodeError, MemoryError) as e:
+        # Only the --memory-budget generator raises, while being iterated
+        print(f"Error reading file: {e}")
+        sys.exit(1)
+
+    if not found:
         print("No duplicate lines found.")
 
 
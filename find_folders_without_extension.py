@@ -1,6 +1,8 @@
 import os
 import argparse
 
+from instrumentation import count, instrumented, phase
+
 def find_folders_without_extension(root_folder, extension):
     """
     Find subfolders that don't contain at least one file with the given extension.
@@ -37,6 +39,97 @@ def find_folders_without_extension(root_folder, extension):
     
     return folders_without_extension
 
+def scan_extensions(root_folder, extensions):
+    """
+    Find which of several extensions each subfolder contains, in a single bottom-up walk.
+    
+    Args:
+        root_folder (str): Path to the root folder to search
+        extensions (list): File extensions to look for (e.g., ['mp4', '.mkv'])
+    
+    Returns:
+        dict: For every subfolder (root excluded), a tuple of two sets of extensions
+            (with leading dot): found directly in the folder, found in the folder or below it
+    """
+    extensions = [
+        (ext if ext.startswith('.') else '.' + ext).lower() for ext in extensions
+    ]
+    folders = {}
+    subtree_extensions = {}
+    
+    try:
+        # Bottom-up, so subfolders are always done before their parent
+        for dirpath, dirnames, filenames in os.walk(root_folder, topdown=False):
+            names = [filename.lower() for filename in filenames]
+            direct = {
+                ext for ext in extensions
+                if any(name.endswith(ext) for name in names)
+            }
+            
+            subtree = set(direct)
+            for dirname in dirnames:
+                subtree |= subtree_extensions.pop(os.path.join(dirpath, dirname), set())
+            subtree_extensions[dirpath] = subtree
+            
+            if dirpath != root_folder:
+                folders[dirpath] = (direct, subtree)
+                
+    except PermissionError as e:
+        print(f"Permission denied: {e}")
+    except Exception as e:
+        print(f"Error processing directory: {e}")
+    
+    return folders
+
+def print_report(folders, extensions):
+    """Print a folder by extension table: 'here', 'below' (only in subfolders) or '-'"""
+    extensions = [
+        (ext if ext.startswith('.') else '.' + ext).lower() for ext in extensions
+    ]
+    width = max(len(ext) for ext in extensions) + 2
+    print("".join(ext.ljust(width) for ext in extensions) + "folder")
+    for folder in sorted(folders):
+        direct, subtree = folders[folder]
+        cells = [
+            "here" if ext in direct else "below" if ext in subtree else "-"
+            for ext in extensions
+        ]
+        print("".join(cell.ljust(width) for cell in cells) + folder)
+
+def print_folders(folders, extension, verbose):
+    if folders:
+        print(f"Subfolders without any '{extension}' files:")
+        for folder in sorted(folders):
+            print(folder)
+        if verbose:
+            print(f"\nTotal: {len(folders)} folders found")
+    else:
+        print(f"No subfolders found without '{extension}' files.")
+
+def find_folders_from_index(args):
+    """
+    Answer from a FilesystemIndex, returns None if the folder isn't indexed.
+    
+    Returns:
+        dict: List of folders without files for each of the extensions
+    """
+    from fs_index import FilesystemIndex
+    
+    index = FilesystemIndex(args.index)
+    try:
+        if args.refresh:
+            index.refresh(args.folder_path)
+        return {
+            extension: index.find_folders_without_extension(args.folder_path, extension)
+            for extension in args.extensions
+        }
+    except LookupError as e:
+        print(f"Error: {e}")
+        return None
+    finally:
+        index.close()
+
+@instrumented('find_folders_without_extension')
 def main():
     parser = argparse.ArgumentParser(
         description="List subfolders that don't contain at least one file with a given extension"
@@ -46,17 +139,42 @@ def main():
         help="Path to the root folder to search"
     )
     parser.add_argument(
-        "extension", 
-        help="File extension to look for (e.g., txt, py, pdf)"
+        "extensions", 
+        nargs="+",
+        metavar="extension",
+        help="File extension to look for (e.g., txt, py, pdf), several are checked in one pass"
+    )
+    parser.add_argument(
+        "-s", "--subtree",
+        action="store_true",
+        help="Also count files in subfolders, a folder is listed only if its whole subtree lacks the extension"
+    )
+    parser.add_argument(
+        "-r", "--report",
+        action="store_true",
+        help="Print which extensions every subfolder contains, directly ('here') or in subfolders ('below')"
     )
     parser.add_argument(
         "-v", "--verbose", 
         action="store_true",
         help="Show verbose output"
     )
+    parser.add_argument(
+        "--index",
+        metavar="DB",
+        help="Answer from this filesystem index (see fs_index.py) instead of walking the tree"
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="With --index, incrementally refresh the index for the folder first"
+    )
     
     args = parser.parse_args()
     
+    if args.index and (args.subtree or args.report):
+        parser.error("--subtree and --report need a walk and can't be used with --index")
+    
     # Validate folder path
     if not os.path.exists(args.folder_path):
         print(f"Error: Folder '{args.folder_path}' does not exist.")
@@ -66,18 +184,38 @@ def main():
         print(f"Error: '{args.folder_path}' is not a directory.")
         return
     
-    # Find folders without the specified extension
-    folders = find_folders_without_extension(args.folder_path, args.extension)
+    # Find folders without the specified extensions
+    if args.index:
+        with phase('index'):
+            folders_by_extension = find_folders_from_index(args)
+        if folders_by_extension is None:
+            return
+    elif len(args.extensions) == 1 and not (args.subtree or args.report):
+        extension = args.extensions[0]
+        with phase('walk'):
+            folders_by_extension = {
+                extension: find_folders_without_extension(args.folder_path, extension)
+            }
+    else:
+        with phase('walk'):
+            folders = scan_extensions(args.folder_path, args.extensions)
+        if args.report:
+            print_report(folders, args.extensions)
+            return
+        
+        which = 1 if args.subtree else 0
+        folders_by_extension = {}
+        for extension in args.extensions:
+            normalized = (extension if extension.startswith('.') else '.' + extension).lower()
+            folders_by_extension[extension] = [
+                folder for folder, found in folders.items()
+                if normalized not in found[which]
+            ]
     
     # Display results
-    if folders:
-        print(f"Subfolders without any '{args.extension}' files:")
-        for folder in sorted(folders):
-            print(folder)
-        if args.verbose:
-            print(f"\nTotal: {len(folders)} folders found")
-    else:
-        print(f"No subfolders found without '{args.extension}' files.")
+    for extension, folders in folders_by_extension.items():
+        print_folders(folders, extension, args.verbose)
+        count('folders', len(folders))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,308 @@
+"""
+Persistent filesystem metadata index.
+
+Keeps paths, extensions, sizes and mtimes of a directory tree in SQLite, so that
+list_files_with_extension and find_folders_without_extension can answer without
+walking the tree. A refresh only re-lists directories whose mtime changed; file sizes
+and mtimes are updated when their directory is re-listed (use --full to re-list all).
+Symlinked directories are not followed.
+
+Usage: python fs_index.py index.db /path/to/share [--full]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import PurePath
+
+from instrumentation import count, instrumented, phase
+
+DEFAULT_WORKERS = 16
+
+
+def _depth(path):
+    return len(PurePath(path).parts)
+
+
+def _subtree_bounds(path):
+    """Range of path strings strictly below path, for an indexed range query"""
+    prefix = path.rstrip(os.sep) + os.sep
+    return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+
+def _file_ext(name):
+    """Lowercase text after the last dot, None if there is no dot"""
+    if "." not in name:
+        return None
+    return name.lower().rpartition(".")[2]
+
+
+def _probe_directory(path, known_mtime_ns, full):
+    """
+    Stat a directory and list it only if it changed since known_mtime_ns.
+
+    Returns:
+        tuple: (mtime_ns, listing) where listing is None if unchanged, otherwise
+            (files, subdirs) with files as (name, is_file, size, mtime_ns) tuples
+    """
+    mtime_ns = os.stat(path).st_mtime_ns
+    if mtime_ns == known_mtime_ns and not full:
+        return mtime_ns, None
+
+    files = []
+    subdirs = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif entry.is_dir():
+                continue
+            elif entry.is_file():
+                try:
+                    stat = entry.stat()
+                    files.append((entry.name, True, stat.st_size, stat.st_mtime_ns))
+                except OSError:
+                    files.append((entry.name, True, 0, 0))
+            else:
+                files.append((entry.name, False, 0, 0))
+    return mtime_ns, (files, subdirs)
+
+
+class FilesystemIndex:
+    def __init__(self, db_path="fs_index.db"):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.create_function(
+            "lower_endswith",
+            2,
+            lambda name, suffix: name.lower().endswith(suffix),
+            deterministic=True,
+        )
+        self._init_db()
+
+    def _init_db(self):
+        """Initialize the database with the required table structure"""
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS dirs (
+                    id INTEGER PRIMARY KEY,
+                    path TEXT NOT NULL UNIQUE,
+                    parent_id INTEGER,
+                    depth INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    dir_id INTEGER NOT NULL REFERENCES dirs (id),
+                    name TEXT NOT NULL,
+                    ext TEXT,
+                    is_file INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL
+                )
+            """)
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS files_dir_id ON files (dir_id)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS files_ext ON files (ext, dir_id)"
+            )
+
+    def close(self):
+        self.conn.close()
+
+    def _subtree_dirs(self, root):
+        low, high = _subtree_bounds(root)
+        return self.conn.execute(
+            "SELECT id, path, parent_id, mtime_ns FROM dirs WHERE path = ? OR (path >= ? AND path < ?)",
+            (root, low, high),
+        ).fetchall()
+
+    def refresh(self, root, full=False, workers=DEFAULT_WORKERS):
+        """
+        Bring the index of the tree under root up to date.
+
+        Returns:
+            tuple: (number of re-listed directories, number of unchanged directories)
+        """
+        root = os.path.abspath(root)
+        known = {}
+        children = {}
+        for dir_id, path, parent_id, mtime_ns in self._subtree_dirs(root):
+            known[path] = (dir_id, mtime_ns)
+            children.setdefault(parent_id, []).append(path)
+
+        seen = set()
+        relisted = unchanged = 0
+
+        with self.conn, ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = {}
+
+            def submit(path, parent_id):
+                known_mtime_ns = known.get(path, (None, None))[1]
+                future = executor.submit(_probe_directory, path, known_mtime_ns, full)
+                pending[future] = (path, parent_id)
+
+            # Refreshing a subdirectory of an indexed tree keeps it linked to its parent,
+            # else a refresh of the whole tree would find it unreachable and delete it
+            parent = os.path.dirname(root)
+            row = self.conn.execute(
+                "SELECT id FROM dirs WHERE path = ?", (parent,)
+            ).fetchone()
+            submit(root, row[0] if row is not None and parent != root else None)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path, parent_id = pending.pop(future)
+                    try:
+                        mtime_ns, listing = future.result()
+                    except OSError as e:
+                        print(f"Warning: can't list {path}: {e}", file=sys.stderr)
+                        # Unreachable isn't gone (an unmounted share, a network error),
+                        # keep what is known of the subtree until it can be listed
+                        stack = [path]
+                        while stack:
+                            known_id = known.get(stack.pop(), (None, None))[0]
+                            if known_id is not None:
+                                seen.add(known_id)
+                                stack.extend(children.get(known_id, []))
+                        continue
+
+                    if listing is None:
+                        dir_id = known[path][0]
+                        seen.add(dir_id)
+                        unchanged += 1
+                        for child in children.get(dir_id, []):
+                            submit(child, dir_id)
+                        continue
+
+                    dir_id = self._store_directory(
+                        path, parent_id, mtime_ns, listing[0]
+                    )
+                    seen.add(dir_id)
+                    relisted += 1
+                    for subdir in listing[1]:
+                        submit(subdir, dir_id)
+
+            gone = [(dir_id,) for dir_id, _ in known.values() if dir_id not in seen]
+            self.conn.executemany("DELETE FROM files WHERE dir_id = ?", gone)
+            self.conn.executemany("DELETE FROM dirs WHERE id = ?", gone)
+
+        return relisted, unchanged
+
+    def _store_directory(self, path, parent_id, mtime_ns, files):
+        dir_id = self.conn.execute(
+            """
+            INSERT INTO dirs (path, parent_id, depth, mtime_ns) VALUES (?, ?, ?, ?)
+            ON CONFLICT (path) DO UPDATE SET parent_id = excluded.parent_id, mtime_ns = excluded.mtime_ns
+            RETURNING id
+            """,
+            (path, parent_id, _depth(path), mtime_ns),
+        ).fetchone()[0]
+        self.conn.execute("DELETE FROM files WHERE dir_id = ?", (dir_id,))
+        self.conn.executemany(
+            "INSERT INTO files (dir_id, name, ext, is_file, size, mtime_ns) VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (dir_id, name, _file_ext(name), is_file, size, file_mtime_ns)
+                for name, is_file, size, file_mtime_ns in files
+            ),
+        )
+        return dir_id
+
+    def _require_indexed(self, directory):
+        path = os.path.abspath(directory)
+        row = self.conn.execute(
+            "SELECT depth FROM dirs WHERE path = ?", (path,)
+        ).fetchone()
+        if row is None:
+            raise LookupError(
+                f"'{directory}' is not in index {self.db_path}, refresh it first"
+            )
+        return path, row[0]
+
+    def iter_files_with_extension(
+        self, directory, extension, hide_extension=False, max_depth=0
+    ):
+        """Yield file names like list_files_with_extension.list_files_with_extension"""
+        path, depth = self._require_indexed(directory)
+        ext = extension.lower()
+        low, high = _subtree_bounds(path)
+        rows = self.conn.execute(
+            """
+            SELECT files.name FROM files
+            JOIN dirs ON dirs.id = files.dir_id
+            WHERE files.ext = ? AND files.is_file AND length(files.name) > ?
+                AND (dirs.path = ? OR (dirs.path >= ? AND dirs.path < ?))
+                AND dirs.depth <= ?
+            """,
+            (ext, len(ext) + 1, path, low, high, depth + max_depth),
+        )
+        for (name,) in rows:
+            yield name[: -len(ext) - 1] if hide_extension else name
+
+    def find_folders_without_extension(self, root_folder, extension):
+        """Same result as find_folders_without_extension.find_folders_without_extension"""
+        path, _ = self._require_indexed(root_folder)
+        if not extension.startswith("."):
+            extension = "." + extension
+        extension = extension.lower()
+        low, high = _subtree_bounds(path)
+
+        if "." in extension[1:]:
+            has_extension = "SELECT 1 FROM files WHERE files.dir_id = dirs.id AND lower_endswith(files.name, ?)"
+            param = extension
+        else:
+            has_extension = "SELECT 1 FROM files WHERE files.dir_id = dirs.id AND files.ext = ?"
+            param = extension[1:]
+
+        rows = self.conn.execute(
+            f"""
+            SELECT dirs.path FROM dirs
+            WHERE dirs.path >= ? AND dirs.path < ? AND NOT EXISTS ({has_extension})
+            """,
+            (low, high, param),
+        )
+        # Report paths the way os.walk would build them from the given root
+        return [os.path.join(root_folder, os.path.relpath(p, path)) for (p,) in rows]
+
+
+@instrumented("fs_index")
+def main():
+    parser = argparse.ArgumentParser(
+        description="Create or incrementally refresh a filesystem metadata index"
+    )
+    parser.add_argument("db", help="Index database file path")
+    parser.add_argument("roots", nargs="+", help="Directories to index")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Re-list every directory, also refreshing sizes and mtimes of files",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"Number of directories listed in parallel (default: {DEFAULT_WORKERS})",
+    )
+    args = parser.parse_args()
+
+    index = FilesystemIndex(args.db)
+    try:
+        for root in args.roots:
+            with phase("refresh"):
+                relisted, unchanged = index.refresh(
+                    root, args.full, max(args.workers, 1)
+                )
+            count("relisted_dirs", relisted)
+            count("unchanged_dirs", unchanged)
+            print(f"{root}: re-listed {relisted}, unchanged {unchanged} directories")
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Shared instrumentation for the script entry points.
+
+Decorate a script's main() with @instrumented("name") and it accepts two extra flags,
+taken out of sys.argv before the script parses its own arguments:
+
+    --stats[=PATH]    phase timers, counters and tracemalloc peak memory
+    --profile[=PATH]  cProfile, PATH receives the raw pstats dump
+
+Either flag writes a JSON report to stderr, or to the --stats PATH. Inside the
+scripts, phase("name") times a block and count("name", n) bumps a counter; both
+are no-ops unless a flag is given.
+
+cProfile, tracemalloc and json are only imported when a flag is given, importing
+this module has to stay cheap as every script does it.
+"""
+
+import functools
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+PROFILE_TOP = 25
+
+
+class Stats:
+    def __init__(self):
+        self.counters: Counter[str] = Counter()
+        self.phases: dict[str, dict] = {}
+
+    def add_phase(self, name: str, seconds: float):
+        phase = self.phases.setdefault(name, {"seconds": 0.0, "calls": 0})
+        phase["seconds"] += seconds
+        phase["calls"] += 1
+
+
+_stats: Stats | None = None
+
+
+def count(name: str, n: int = 1):
+    if _stats is not None:
+        _stats.counters[name] += n
+
+
+@contextmanager
+def phase(name: str):
+    if _stats is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _stats.add_phase(name, time.perf_counter() - start)
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process, None where it can't be measured"""
+    try:
+        import resource
+    except ImportError:
+        resource = None
+
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        ctypes.windll.psapi.GetProcessMemoryInfo(
+            handle, ctypes.byref(counters), counters.cb
+        )
+        return counters.PeakWorkingSetSize
+
+    return None
+
+
+def _pop_flag(argv: list[str], flag: str):
+    """
+    Remove --flag or --flag=VALUE from argv.
+
+    Returns:
+        None if the flag is absent, "" if given without a value, otherwise the value
+    """
+    value = None
+    for arg in list(argv):
+        if arg == flag:
+            value = ""
+        elif arg.startswith(f"{flag}="):
+            value = arg.split("=", 1)[1]
+        else:
+            continue
+        argv.remove(arg)
+    return value
+
+
+def _profile_top(profiler) -> list[dict]:
+    import io
+    import pstats
+
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = []
+    for (filename, line, function), row in stats.stats.items():
+        _, calls, total, cumulative, _ = row
+        rows.append(
+            {
+                "function": f"{filename}:{line}({function})",
+                "calls": calls,
+                "total_seconds": round(total, 6),
+                "cumulative_seconds": round(cumulative, 6),
+            }
+        )
+    rows.sort(key=lambda row: row["cumulative_seconds"], reverse=True)
+    return rows[:PROFILE_TOP]
+
+
+@contextmanager
+def run(name: str, argv: list[str] | None = None):
+    """Instrument the enclosed block if --stats or --profile is in argv (default: sys.argv)"""
+    global _stats
+
+    argv = sys.argv if argv is None else argv
+    stats_path = _pop_flag(argv, "--stats")
+    profile_path = _pop_flag(argv, "--profile")
+    if stats_path is None and profile_path is None:
+        yield
+        return
+
+    import cProfile
+    import json
+    import tracemalloc
+
+    _stats = Stats()
+    if stats_path is not None:
+        tracemalloc.start()
+    profiler = cProfile.Profile() if profile_path is not None else None
+
+    report = {"script": name, "argv": argv[1:], "exit_code": 0, "error": None}
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    except SystemExit as e:
+        report["exit_code"] = e.code
+        raise
+    except BaseException as e:
+        report["exit_code"] = 1
+        report["error"] = repr(e)
+        raise
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        report["wall_seconds"] = round(time.perf_counter() - wall_start, 6)
+        report["cpu_seconds"] = round(time.process_time() - cpu_start, 6)
+        report["phases"] = {
+            phase_name: {"seconds": round(p["seconds"], 6), "calls": p["calls"]}
+            for phase_name, p in _stats.phases.items()
+        }
+        report["counters"] = dict(_stats.counters)
+        report["peak_rss_bytes"] = peak_rss_bytes()
+        if tracemalloc.is_tracing():
+            report["peak_traced_bytes"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        if profiler is not None:
+            if profile_path:
+                profiler.dump_stats(profile_path)
+            report["profile"] = {
+                "path": profile_path or None,
+                "top": _profile_top(profiler),
+            }
+        _stats = None
+
+        output = json.dumps(report, indent=2)
+        if stats_path:
+            with open(stats_path, "w", encoding="utf8") as file:
+                file.write(output + "\n")
+        else:
+            print(output, file=sys.stderr)
+
+
+def instrumented(name: str):
+    """Decorator for entry points, see run()"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with run(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
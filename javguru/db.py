@@ -1,15 +1,25 @@
 import argparse
 import shutil
 import sqlite3
+from contextlib import closing
+from dataclasses import dataclass, field
 from pathlib import Path
 
 from uuid_extensions import uuid7str
 
 
+@dataclass
+class IdLookup:
+    new: list[str] = field(default_factory=list)
+    existing: list[str] = field(default_factory=list)
+    rated: list[str] = field(default_factory=list)
+
+
 class JavguruDatabase:
-    def __init__(self, db_path="database.db"):
+    def __init__(self, db_path="database.db", backup=True):
         self.db_path = db_path
-        self._make_db_backup()
+        if backup:
+            self._make_db_backup()
         self._init_db()
 
     def _init_db(self):
@@ -81,6 +91,124 @@ class JavguruDatabase:
             else:
                 print(f"Successfully updated comment for ID: {id}")
 
+    def get_descriptions(self) -> dict[str, str]:
+        """Return descriptions of all rows keyed by id, fetched in a single query"""
+        with sqlite3.connect(self.db_path) as conn:
+            return dict(conn.execute("SELECT id, description FROM items"))
+
+    def lookup_ids(self, ids) -> IdLookup:
+        """
+        Resolve many candidate ids at once.
+
+        Candidates are loaded into a temp table and joined against items in a single query.
+        Existing ids that also have a rating are listed in both existing and rated.
+        """
+        result = IdLookup()
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            conn.execute("CREATE TEMP TABLE candidates (id TEXT NOT NULL PRIMARY KEY)")
+            conn.executemany(
+                "INSERT OR IGNORE INTO candidates (id) VALUES (?)",
+                ((id,) for id in ids),
+            )
+            rows = conn.execute("""
+                SELECT candidates.id, items.id IS NOT NULL, items.rating IS NOT NULL
+                FROM candidates
+                LEFT JOIN items ON items.id = candidates.id
+                ORDER BY candidates.id
+            """)
+            for id, exists, rated in rows:
+                if not exists:
+                    result.new.append(id)
+                    continue
+                result.existing.append(id)
+                if rated:
+                    result.rated.append(id)
+
+        return result
+
+    def sync_rows(self, inserts, updates, backup=False):
+        """
+        Insert new rows and update descriptions of existing ones in one transaction.
+
+        Args:
+            inserts: Iterable of (id, description) pairs to insert
+            updates: Iterable of (id, description) pairs whose description changed
+            backup: Copy the database first, only if there is something to write
+        """
+        inserts = list(inserts)
+        updates = [(description, id) for id, description in updates]
+        if not inserts and not updates:
+            return
+        if backup:
+            self._make_db_backup()
+
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany(
+                "INSERT INTO items (id, description) VALUES (?, ?)", inserts
+            )
+            conn.executemany("UPDATE items SET description = ? WHERE id = ?", updates)
+            conn.commit()
+
+    def import_ratings_and_comments(self, rows) -> list[str]:
+        """
+        Apply rating and comment changes from many rows in a single transaction.
+
+        Args:
+            rows: Iterable of dicts with an "id" key and optional "rating" and "comment" keys.
+                A missing key leaves that column untouched, None clears it.
+
+        Returns:
+            list: Ids that don't exist in the database, nothing is applied for them
+        """
+        ratings = []
+        comments = []
+        for row in rows:
+            id = row["id"]
+            if "rating" in row:
+                rating = row["rating"]
+                # bool is an int too, and JSON lines can carry "7" or 7.5
+                if rating is not None and (
+                    not isinstance(rating, int)
+                    or isinstance(rating, bool)
+                    or rating < 1
+                    or rating > 10
+                ):
+                    raise ValueError(
+                        f"Rating for ID '{id}' must be an integer between 1 and 10 or None"
+                    )
+                ratings.append((rating, id))
+            if "comment" in row:
+                comments.append((row["comment"], id))
+
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            conn.execute("CREATE TEMP TABLE imported (id TEXT NOT NULL PRIMARY KEY)")
+            conn.executemany(
+                "INSERT OR IGNORE INTO imported (id) VALUES (?)",
+                ((id,) for _, id in ratings + comments),
+            )
+            missing = [
+                id
+                for (id,) in conn.execute("""
+                    SELECT imported.id FROM imported
+                    WHERE imported.id NOT IN (SELECT id FROM items)
+                    ORDER BY imported.id
+                """)
+            ]
+            conn.executemany("UPDATE items SET rating = ? WHERE id = ?", ratings)
+            conn.executemany("UPDATE items SET comment = ? WHERE id = ?", comments)
+            conn.commit()
+
+        return missing
+
+    def iter_rows(self, batch_size=1000):
+        """Stream all rows as (id, description, rating, comment, timestamp) tuples, ordered by id"""
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            cursor = conn.execute(
+                "SELECT id, description, rating, comment, timestamp FROM items ORDER BY id"
+            )
+            while batch := cursor.fetchmany(batch_size):
+                yield from batch
+
 
 def test():
     parser = argparse.ArgumentParser(description="SQLite Database Manager")
@@ -1,6 +1,9 @@
+import fileinput
+import os
 import re
 
 RE = re.compile(r"^\[(.+?)\]\s*(.*?)\W*(\.mp4)?$")
+ID_RE = re.compile(r"^\[?(\w+-\d+)\]?", flags=re.MULTILINE)
 
 
 def extract_id_and_description(filename: str) -> tuple[str, str]:
@@ -10,6 +13,38 @@ def extract_id_and_description(filename: str) -> tuple[str, str]:
     return id, description
 
 
+def iter_lines(paths):
+    """Stream non-empty lines from the given files one at a time, stdin if paths is empty or '-'"""
+    with fileinput.input(paths or ("-",), encoding="utf8") as lines:
+        for line in lines:
+            line = line.rstrip("\r\n")
+            if line.strip():
+                yield line
+
+
+def extract_ids(lines):
+    """Yield each id found at the start of a line once, in order of first appearance"""
+    seen: set[str] = set()
+    for line in lines:
+        match = ID_RE.match(line)
+        if match is None:
+            continue
+        id = match.group(1)
+        if id not in seen:
+            seen.add(id)
+            yield id
+
+
+def scan_video_files(directories, extensions=(".mp4",)):
+    """Recursively yield names of files with one of the given extensions"""
+    extensions = tuple(ext.lower() for ext in extensions)
+    for directory in directories:
+        for _, _, filenames in os.walk(directory):
+            for filename in filenames:
+                if filename.lower().endswith(extensions):
+                    yield filename
+
+
 if __name__ == "__main__":
     assert ("SOMEID-12345", "Some description") == extract_id_and_description(
         "[SOMEID-12345] Some description.mp4"
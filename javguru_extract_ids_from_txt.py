@@ -1,21 +1,19 @@
 # First, extract filenames in Total Commander (Shift + F12 by default)
-# Then run this script, providing that txt file
+# Then run this script, providing that txt file (or several, or '-' / nothing for stdin)
 
 
-import re
 import sys
-from pathlib import Path
 
-if __name__ == "__main__":
-    try:
-        input_filepath = sys.argv[1]
-    except IndexError:
-        raise RuntimeError("provide txt file with javguru video list")
+from instrumentation import count, instrumented
+from javguru.files import extract_ids, iter_lines
+
 
-    input_filepath = Path(input_filepath)
-    input = input_filepath.read_text(encoding="utf8")
+@instrumented("javguru_extract_ids_from_txt")
+def main():
+    for id in extract_ids(iter_lines(sys.argv[1:])):
+        sys.stdout.write(f"{id}\n")
+        count("ids")
 
-    RE = re.compile(r"^\[?(\w+-\d+)\]?", flags=re.MULTILINE)
 
-    for match in RE.finditer(input):
-        print(match.group(1))
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# Check which ids are already in the database before downloading.
+# Input is the output of javguru_extract_ids_from_txt (one id per line),
+# raw '[ID] description.mp4' listings work too. Reads stdin when no file is given.
+
+import argparse
+import sys
+
+from instrumentation import instrumented, phase
+from javguru.db import JavguruDatabase
+from javguru.files import ID_RE
+
+
+def read_ids(lines):
+    for line in lines:
+        match = ID_RE.match(line.strip())
+        if match:
+            yield match.group(1)
+
+
+@instrumented("javguru_lookup_ids")
+def main():
+    parser = argparse.ArgumentParser(
+        description="Bulk lookup of javguru ids: which are new, existing and rated"
+    )
+    parser.add_argument("--db", help="Database file path", required=True)
+    parser.add_argument(
+        "ids",
+        nargs="?",
+        help="Text file with ids, one per line (default: stdin)",
+    )
+    parser.add_argument(
+        "--only",
+        choices=["new", "existing", "rated"],
+        help="Print only ids of this kind, without headers",
+    )
+    args = parser.parse_args()
+
+    db = JavguruDatabase(args.db, backup=False)
+
+    with phase("lookup"):
+        if args.ids:
+            with open(args.ids, encoding="utf8") as f:
+                result = db.lookup_ids(read_ids(f))
+        else:
+            result = db.lookup_ids(read_ids(sys.stdin))
+
+    if args.only:
+        for id in getattr(result, args.only):
+            print(id)
+        return
+
+    for kind in ("new", "existing", "rated"):
+        ids = getattr(result, kind)
+        print(f"{kind} ({len(ids)}):")
+        for id in ids:
+            print(f"  {id}")
+
+
+if __name__ == "__main__":
+    main()
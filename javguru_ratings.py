@@ -0,0 +1,96 @@
+# Bulk import of ratings/comments and streaming export of the javguru database.
+#
+# Import files are CSV with an "id" column and optional "rating"/"comment" columns
+# (an empty cell leaves the value untouched), or JSON lines with the same keys
+# (a missing key leaves the value untouched, null clears it).
+
+import argparse
+import csv
+import json
+import sys
+from pathlib import Path
+
+from instrumentation import instrumented, phase
+from javguru.db import JavguruDatabase
+
+COLUMNS = ["id", "description", "rating", "comment", "timestamp"]
+
+
+def read_csv_rows(path: Path):
+    with path.open(encoding="utf8", newline="") as f:
+        for row in csv.DictReader(f):
+            out = {"id": row["id"].strip()}
+            if row.get("rating"):
+                out["rating"] = int(row["rating"])
+            if row.get("comment"):
+                out["comment"] = row["comment"]
+            yield out
+
+
+def read_jsonl_rows(path: Path):
+    with path.open(encoding="utf8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def import_file(db: JavguruDatabase, path: Path):
+    if path.suffix.lower() == ".csv":
+        rows = read_csv_rows(path)
+    else:
+        rows = read_jsonl_rows(path)
+
+    missing = db.import_ratings_and_comments(rows)
+    for id in missing:
+        print(f"Warning: ID '{id}' not found. Nothing updated.")
+    print(f"Done, {len(missing)} ids not found")
+
+
+def export(db: JavguruDatabase, format: str, out):
+    if format == "csv":
+        writer = csv.writer(out)
+        writer.writerow(COLUMNS)
+        writer.writerows(db.iter_rows())
+    else:
+        for row in db.iter_rows():
+            out.write(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + "\n")
+
+
+@instrumented("javguru_ratings")
+def main():
+    parser = argparse.ArgumentParser(
+        description="Bulk import ratings/comments into, or export, a javguru database"
+    )
+    parser.add_argument("--db", help="Database file path", required=True)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser(
+        "import", help="Apply ratings and comments from a .csv or .jsonl file"
+    )
+    import_parser.add_argument("file", help="CSV or JSON lines file")
+
+    export_parser = subparsers.add_parser("export", help="Dump all rows")
+    export_parser.add_argument(
+        "--format", choices=["csv", "jsonl"], default="csv", help="Default: csv"
+    )
+    export_parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+
+    args = parser.parse_args()
+
+    if args.command == "import":
+        db = JavguruDatabase(args.db)
+        with phase("import"):
+            import_file(db, Path(args.file))
+        return
+
+    db = JavguruDatabase(args.db, backup=False)
+    with phase("export"):
+        if args.output:
+            with open(args.output, "w", encoding="utf8", newline="") as out:
+                export(db, args.format, out)
+        else:
+            export(db, args.format, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
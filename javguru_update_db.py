@@ -1,31 +1,17 @@
 # WARNING
 
 import argparse
-from pathlib import Path
 
+from instrumentation import count, instrumented, phase
 from javguru.db import JavguruDatabase
-from javguru.files import extract_id_and_description
+from javguru.files import extract_id_and_description, iter_lines, scan_video_files
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Javguru Database Manager")
-    parser.add_argument(
-        "--db",
-        help="Database file path (default: database.db)",
-        required=True,
-    )
-    parser.add_argument(
-        "--mp4s",
-        help="A text files with a list of mp4 files, each line in format of '[ID] Some description.mp4'. Such list for example can be obtained from Total Commander command Shift+F12.",
-        required=True,
-    )
-    args = parser.parse_args()
-
-    db = JavguruDatabase(args.db)
-
-    mp4s = Path(args.mp4s).read_text(encoding="utf8").strip().splitlines()
+def insert_from_list(db: JavguruDatabase, mp4s_paths: list[str]):
     inserted = 0
-    for i, mp4 in enumerate(mp4s):
+    total = 0
+    for i, mp4 in enumerate(iter_lines(mp4s_paths)):
+        total += 1
         prefix = f"[{i:05}]"
         try:
             id, description = extract_id_and_description(mp4)
@@ -33,18 +19,106 @@ def main():
             print(
                 f"{prefix} Error: couldn't extract id and description for {mp4}, reason: {e}"
             )
+            count("errors")
             continue
 
         try:
             db.insert_row(id=id, description=description)
         except Exception as e:
             print(f"{prefix} {id} Error: couldn't insert row, reason: {e}")
+            count("errors")
             continue
 
         inserted += 1
+        count("inserted")
         print(f"{prefix} {id} inserted")
 
-    print(f"Done, inserted {inserted} of {len(mp4s)}")
+    print(f"Done, inserted {inserted} of {total}")
+
+
+def sync_with_directories(db: JavguruDatabase, directories: list[str]):
+    """
+    Scan video directories and bring the database in line with them.
+
+    New ids are inserted, ids whose description changed (renamed files) are updated,
+    and ids that are in the database but no longer on disk are only reported.
+    """
+    on_disk: dict[str, str] = {}
+    with phase("scan"):
+        for mp4 in scan_video_files(directories):
+            count("files")
+            try:
+                id, description = extract_id_and_description(mp4)
+            except Exception as e:
+                print(
+                    f"Error: couldn't extract id and description for {mp4}, reason: {e}"
+                )
+                count("errors")
+                continue
+
+            if id in on_disk:
+                print(f"{id} Warning: found more than once on disk, using {mp4}")
+            on_disk[id] = description
+
+    with phase("read_db"):
+        in_db = db.get_descriptions()
+
+    new_ids = on_disk.keys() - in_db.keys()
+    missing_ids = in_db.keys() - on_disk.keys()
+    changed_ids = {
+        id for id in on_disk.keys() & in_db.keys() if on_disk[id] != in_db[id]
+    }
+
+    inserts = [(id, on_disk[id]) for id in sorted(new_ids)]
+    updates = [(id, on_disk[id]) for id in sorted(changed_ids)]
+    with phase("write_db"):
+        db.sync_rows(inserts, updates, backup=True)
+    count("inserted", len(inserts))
+    count("updated", len(updates))
+    count("missing", len(missing_ids))
+
+    for id, _ in inserts:
+        print(f"{id} inserted")
+    for id, _ in updates:
+        print(f"{id} description updated")
+    for id in sorted(missing_ids):
+        print(f"{id} Warning: in database but not found on disk")
+
+    print(
+        f"Done, inserted {len(inserts)}, updated {len(updates)}, missing {len(missing_ids)}"
+    )
+
+
+@instrumented("javguru_update_db")
+def main():
+    parser = argparse.ArgumentParser(description="Javguru Database Manager")
+    parser.add_argument(
+        "--db",
+        help="Database file path (default: database.db)",
+        required=True,
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument(
+        "--mp4s",
+        nargs="+",
+        metavar="FILE",
+        help="Text files ('-' for stdin) with a list of mp4 files, each line in format of '[ID] Some description.mp4'. Such list for example can be obtained from Total Commander command Shift+F12.",
+    )
+    source.add_argument(
+        "--sync",
+        nargs="+",
+        metavar="DIR",
+        help="Scan these video directories and sync the database with them: insert new ids, update renamed ones and report ids missing on disk.",
+    )
+    args = parser.parse_args()
+
+    # A sync makes its backup only when it has changes to write
+    db = JavguruDatabase(args.db, backup=not args.sync)
+
+    if args.sync:
+        sync_with_directories(db, args.sync)
+    else:
+        insert_from_list(db, args.mp4s)
 
 
 if __name__ == "__main__":
@@ -7,8 +7,13 @@ Lists all files with a given extension, with options to hide extensions and cont
 import argparse
 import os
 import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 
+from instrumentation import count, instrumented, phase
+
+DEFAULT_WORKERS = 16
+
 def list_files_with_extension(directory, extension, hide_extension=False, max_depth=0, current_depth=0):
     """
     Recursively list files with given extension up to specified depth.
@@ -50,6 +55,111 @@ def list_files_with_extension(directory, extension, hide_extension=False, max_de
     
     return files_found
 
+def _split_suffix(name):
+    """Split a file name into stem and suffix the same way pathlib does"""
+    i = name.rfind('.')
+    if 0 < i < len(name) - 1:
+        return name[:i], name[i:]
+    return name, ''
+
+def _scan_directory(directory, suffixes, list_subdirs, follow_symlinks=True):
+    """
+    List one directory with os.scandir, using directory entry types instead of a stat per entry.
+    Without follow_symlinks, symlinks to files or directories are left out.
+    
+    Returns:
+        tuple: (entries of files with one of the suffixes, or any file if suffixes is None,
+            subdirectory paths if list_subdirs)
+    """
+    files_found = []
+    subdirs = []
+    
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not follow_symlinks and entry.is_symlink():
+                    continue
+                if entry.is_file():
+                    if suffixes is None or _split_suffix(entry.name)[1].lower() in suffixes:
+                        files_found.append(entry)
+                elif list_subdirs and entry.is_dir():
+                    subdirs.append(entry.path)
+                    
+    except PermissionError:
+        print(f"Warning: Permission denied accessing {directory}", file=sys.stderr)
+    except Exception as e:
+        print(f"Error accessing {directory}: {e}", file=sys.stderr)
+    
+    return files_found, subdirs
+
+def iter_file_entries(directory, extensions=None, max_depth=0, workers=DEFAULT_WORKERS, follow_symlinks=True):
+    """
+    Yield os.DirEntry objects of files with one of the given extensions up to specified depth,
+    as they are found. Directories are listed concurrently on a thread pool, which hides
+    per-call latency of network shares.
+    
+    Args:
+        directory (str): Starting directory
+        extensions (list): File extensions to search for (without dot), None for all files
+        max_depth (int): Maximum subfolder depth to search (0 = current directory only)
+        workers (int): Number of directories listed at the same time
+        follow_symlinks (bool): Whether to yield symlinked files and walk into symlinked
+            directories, which loops forever on a link to a parent with unlimited depth
+    """
+    suffixes = None
+    if extensions is not None:
+        suffixes = {f".{extension.lower()}" for extension in extensions}
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        
+        def submit(path, depth):
+            future = executor.submit(_scan_directory, path, suffixes, depth < max_depth, follow_symlinks)
+            pending[future] = depth
+        
+        submit(directory, 0)
+        
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                depth = pending.pop(future)
+                files_found, subdirs = future.result()
+                for subdir in subdirs:
+                    submit(subdir, depth + 1)
+                yield from files_found
+
+def iter_files_with_extension(directory, extension, hide_extension=False, max_depth=0, workers=DEFAULT_WORKERS):
+    """
+    Yield files with given extension up to specified depth as they are found.
+    Same results as list_files_with_extension, in no particular order.
+    
+    Args:
+        directory (str): Starting directory
+        extension (str): File extension to search for (without dot)
+        hide_extension (bool): Whether to hide file extensions in output
+        max_depth (int): Maximum subfolder depth to search (0 = current directory only)
+        workers (int): Number of directories listed at the same time
+    """
+    for entry in iter_file_entries(directory, [extension], max_depth, workers):
+        yield _split_suffix(entry.name)[0] if hide_extension else entry.name
+
+def list_files_from_index(args, extension):
+    from fs_index import FilesystemIndex
+    
+    index = FilesystemIndex(args.index)
+    try:
+        if args.refresh:
+            index.refresh(args.directory, workers=max(args.workers, 1))
+        return list(index.iter_files_with_extension(
+            args.directory, extension, args.hide_extension, args.depth
+        ))
+    except LookupError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        index.close()
+
+@instrumented('list_files_with_extension')
 def main():
     parser = argparse.ArgumentParser(
         description="List files with given extension in alphabetical order",
@@ -90,6 +200,32 @@ Examples:
         metavar='DEPTH'
     )
     
+    parser.add_argument(
+        '-s', '--stream',
+        action='store_true',
+        help='Print files as soon as they are found instead of in alphabetical order'
+    )
+    
+    parser.add_argument(
+        '-j', '--workers',
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f'Number of directories listed in parallel. Default: {DEFAULT_WORKERS}',
+        metavar='N'
+    )
+    
+    parser.add_argument(
+        '--index',
+        help='Answer from this filesystem index (see fs_index.py) instead of walking the tree',
+        metavar='DB'
+    )
+    
+    parser.add_argument(
+        '--refresh',
+        action='store_true',
+        help='With --index, incrementally refresh the index for the directory first'
+    )
+    
     args = parser.parse_args()
     
     # Validate directory exists
@@ -109,20 +245,26 @@ Examples:
     # Remove leading dot from extension if provided
     extension = args.extension.lstrip('.')
     
-    # Get and sort files
-    files = list_files_with_extension(
-        args.directory,
-        extension,
-        args.hide_extension,
-        args.depth
-    )
+    if args.index:
+        with phase('index'):
+            files = list_files_from_index(args, extension)
+    else:
+        files = iter_files_with_extension(
+            args.directory,
+            extension,
+            args.hide_extension,
+            args.depth,
+            max(args.workers, 1)
+        )
     
-    files.sort()  # Alphabetical order
+    if not args.stream:
+        with phase('walk'):
+            files = sorted(files)  # Alphabetical order
     
     # Display results
-    if files:
-        for file_path in files:
-            print(file_path)
+    for file_path in files:
+        print(file_path, flush=args.stream)
+        count('files')
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
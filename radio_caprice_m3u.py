@@ -1,11 +1,18 @@
+import argparse
+import asyncio
 import json
+import os
+import time
 from collections import defaultdict
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 from pathlib import Path
+from urllib.parse import urljoin, urlsplit
 
 import requests
 from unidecode import unidecode
 
+from instrumentation import count, instrumented, phase
+
 STYLES = {
     "0": "Blues/Funk/Soul",
     "1": "Classical",
@@ -27,20 +34,209 @@ RADIOS_JSON_FILE_PATH = OUT_DIR / Path("caprice_radios.json")
 RADIOS_JSON_URL = "https://github.com/drocheam/caprice/raw/refs/heads/main/radios.json"
 
 
-def get_radios_json() -> dict:
-    if RADIOS_JSON_FILE_PATH.exists():
-        return json.loads(RADIOS_JSON_FILE_PATH.read_text())
+RADIOS_JSON_TTL = 24 * 60 * 60
+
+_session: requests.Session | None = None
+
+
+def get_session() -> requests.Session:
+    """Shared session, so repeated requests reuse pooled connections"""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+    return _session
+
+
+def write_text_atomic(path: Path, text: str):
+    """Write to a temporary file next to path and move it over, readers never see a partial file"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    tmp_path.write_text(text, encoding="utf8")
+    os.replace(tmp_path, path)
+
+
+def get_radios_json(
+    url: str = RADIOS_JSON_URL,
+    file_path: Path = RADIOS_JSON_FILE_PATH,
+    ttl: float = RADIOS_JSON_TTL,
+    session: requests.Session | None = None,
+) -> dict:
+    """
+    Return radios from the cached file, revalidating it once it is older than ttl seconds.
+
+    Revalidation sends the stored ETag/Last-Modified, so an unchanged file costs a 304
+    without a body. If the server can't be reached the stale cache is used.
+    """
+    meta_path = file_path.with_name(f"{file_path.name}.meta")
+    meta = json.loads(meta_path.read_text()) if meta_path.exists() else {}
+    cached = file_path.exists()
+
+    if cached and time.time() - meta.get("fetched_at", 0) < ttl:
+        return json.loads(file_path.read_text(encoding="utf8"))
+
+    headers = {}
+    if cached and meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if cached and meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+
+    try:
+        got = (session or get_session()).get(url, headers=headers, timeout=30)
+    except requests.RequestException as e:
+        if not cached:
+            print(f"couldn't get radios: {e}")
+            exit(1)
+        print(f"couldn't revalidate radios, using cached: {e}")
+        return json.loads(file_path.read_text(encoding="utf8"))
+
+    if got.status_code == 304:
+        meta["fetched_at"] = time.time()
+        write_text_atomic(meta_path, json.dumps(meta))
+        return json.loads(file_path.read_text(encoding="utf8"))
 
-    got = requests.get(RADIOS_JSON_URL)
     if got.status_code != 200:
         print(f"got status code: {got.status_code}")
-        exit(1)
+        if not cached:
+            exit(1)
+        return json.loads(file_path.read_text(encoding="utf8"))
 
     radios = got.json()["radios"]
-    RADIOS_JSON_FILE_PATH.write_text(json.dumps(radios, indent="  "), encoding="utf8")
+    write_text_atomic(file_path, json.dumps(radios, indent="  "))
+    meta = {
+        "fetched_at": time.time(),
+        "etag": got.headers.get("ETag"),
+        "last_modified": got.headers.get("Last-Modified"),
+    }
+    write_text_atomic(meta_path, json.dumps(meta))
     return radios
 
 
+STREAM_HEALTH_FILE_PATH = OUT_DIR / Path("caprice_stream_health.json")
+STREAM_HEALTH_TTL = 24 * 60 * 60
+MAX_REDIRECTS = 3
+
+
+@dataclass
+class StreamHealth:
+    ok: bool
+    status: int | None = None
+    error: str | None = None
+    checked_at: float = 0
+
+
+async def probe_stream(
+    url: str, connect_timeout: float = 3, read_timeout: float = 5
+) -> StreamHealth:
+    """
+    Check that a stream answers with a 2xx status, reading only the status line and
+    headers (ICY servers answer 'ICY 200 OK'). Redirects are followed.
+    """
+    url = url.strip()
+    for _ in range(MAX_REDIRECTS + 1):
+        # A malformed netloc or an out of range port raises ValueError
+        try:
+            parts = urlsplit(url)
+            port = parts.port
+        except ValueError as e:
+            return StreamHealth(ok=False, error=f"bad url: {e}")
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            return StreamHealth(ok=False, error=f"unsupported url: {url}")
+
+        https = parts.scheme == "https"
+        port = port or (443 if https else 80)
+        path = parts.path or "/"
+        if parts.query:
+            path += f"?{parts.query}"
+
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(parts.hostname, port, ssl=https or None),
+                connect_timeout,
+            )
+        # UnicodeError for hostnames the idna codec can't encode
+        except (OSError, UnicodeError, asyncio.TimeoutError) as e:
+            return StreamHealth(ok=False, error=f"connect: {e!r}")
+
+        try:
+            writer.write(
+                f"GET {path} HTTP/1.0\r\n"
+                f"Host: {parts.netloc}\r\n"
+                "User-Agent: radio_caprice_m3u\r\n"
+                "Icy-MetaData: 1\r\n"
+                "Connection: close\r\n\r\n".encode()
+            )
+            await writer.drain()
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), read_timeout)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+            return StreamHealth(ok=False, error=f"read: {e!r}")
+        except asyncio.LimitOverrunError:
+            return StreamHealth(ok=False, error="read: headers too long")
+        finally:
+            writer.close()
+
+        status_line, *header_lines = head.decode("latin-1").split("\r\n")
+        try:
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            return StreamHealth(ok=False, error=f"bad status line: {status_line!r}")
+
+        headers = {}
+        for line in header_lines:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if status in (301, 302, 303, 307, 308) and "location" in headers:
+            url = urljoin(url, headers["location"])
+            continue
+
+        return StreamHealth(ok=200 <= status < 300, status=status)
+
+    return StreamHealth(ok=False, error="too many redirects")
+
+
+def check_streams(
+    urls: list[str],
+    concurrency: int = 200,
+    cache_path: Path = STREAM_HEALTH_FILE_PATH,
+    ttl: float = STREAM_HEALTH_TTL,
+) -> dict[str, StreamHealth]:
+    """
+    Probe all urls concurrently, at most concurrency at a time. Results are cached in
+    cache_path and urls checked within the last ttl seconds aren't probed again.
+    """
+    cache = {}
+    if cache_path.exists():
+        cache = {
+            url: StreamHealth(**health)
+            for url, health in json.loads(cache_path.read_text()).items()
+        }
+
+    now = time.time()
+    stale = sorted(
+        {url for url in urls if url not in cache or now - cache[url].checked_at >= ttl}
+    )
+
+    async def probe_all():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def probe(url):
+            async with semaphore:
+                health = await probe_stream(url)
+            health.checked_at = time.time()
+            return health
+
+        return await asyncio.gather(*map(probe, stale))
+
+    if stale:
+        cache.update(zip(stale, asyncio.run(probe_all())))
+        write_text_atomic(
+            cache_path,
+            json.dumps({url: asdict(health) for url, health in cache.items()}),
+        )
+
+    return {url: cache[url] for url in urls}
+
+
 def normalize_style(style: str) -> str:
     return unidecode(style).replace("/", "_").replace(" ", "")
 
@@ -67,18 +263,46 @@ class M3U:
     def sort_by_title(self):
         self.streams.sort(key=lambda s: s.title)
 
-    def save_to_file(self, dir: Path, file_stem: Path):
+    def save_to_file(
+        self,
+        dir: Path,
+        file_stem: Path,
+        health: dict[str, StreamHealth] | None = None,
+        drop_dead: bool = True,
+    ):
+        """Streams that failed a health check are dropped, or flagged with a [dead] title"""
         contents = [self.TITLE]
         for stream in self.streams:
-            contents.append(f"#EXTINF:-1,{self._normalize_title(stream.title)}")
+            title = self._normalize_title(stream.title)
+            if health is not None and stream.url in health and not health[stream.url].ok:
+                if drop_dead:
+                    continue
+                title = f"[dead] {title}"
+            contents.append(f"#EXTINF:-1,{title}")
             contents.append(stream.url.strip())
 
         filepath = dir / file_stem.with_suffix(".m3u")
         filepath.write_text("\n".join(contents))
 
 
-if __name__ == "__main__":
-    radios = get_radios_json()
+@instrumented("radio_caprice_m3u")
+def main():
+    parser = argparse.ArgumentParser(description="Make M3U playlists of Caprice radios")
+    parser.add_argument(
+        "--check-streams",
+        action="store_true",
+        help="Probe all stream urls concurrently and drop dead ones from the playlists",
+    )
+    parser.add_argument(
+        "--keep-dead",
+        action="store_true",
+        help="With --check-streams, keep dead streams but flag their titles",
+    )
+    args = parser.parse_args()
+
+    with phase("fetch"):
+        radios = get_radios_json()
+    count("radios", len(radios))
 
     m3us: defaultdict[str, M3U] = defaultdict(M3U)
     for radio in radios:
@@ -87,9 +311,23 @@ if __name__ == "__main__":
         url = radio["url"]
         m3us[style].add_stream(title=name, url=url)
 
+    health = None
+    if args.check_streams:
+        with phase("check_streams"):
+            health = check_streams([radio["url"] for radio in radios])
+        dead = sum(not h.ok for h in health.values())
+        print(f"{dead} of {len(health)} streams are dead")
+        count("dead_streams", dead)
+
     for style, m3u in m3us.items():
         file_stem = "Caprice__" + normalize_style(STYLES[style])
         try:
-            m3u.save_to_file(OUT_DIR, Path(file_stem))
+            m3u.save_to_file(
+                OUT_DIR, Path(file_stem), health, drop_dead=not args.keep_dead
+            )
         except Exception as e:
             print(f"couldn't save to file {style}: {e}")
+
+
+if __name__ == "__main__":
+    main()